@@ -0,0 +1,191 @@
+"""
+Stateless signed access tokens for the API gateway.
+
+With AUTH_TOKEN_MODE=stateless, the gateway issues HMAC-SHA256 signed tokens
+that carry the user id and an expiry. Any gateway process holding the same
+AUTH_TOKEN_SECRET can validate them with no session lookup. Validation is a
+signature check, an expiry check and a set lookup, all pure CPU.
+
+Logout adds the token's id (jti) to a revocation list until the token would
+have expired anyway. Checking it is a set lookup; the list is re-read from its
+shared store every REVOCATION_REFRESH_INTERVAL seconds, so a logout reaches
+the other workers within that interval. REVOCATION_STORE selects the store:
+
+- storage: the storage service's revoked_tokens table, shared by every replica
+- sqlite: a SQLite file at REVOCATION_SQLITE_PATH, shared by the workers on one host
+- memory: this process only (logout does not reach other workers)
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+
+TOKEN_PREFIX = "st1"
+
+
+def _b64(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+class TokenSigner:
+    """Issues and verifies `st1.<user_id>.<expires>.<jti>.<signature>` tokens."""
+
+    def __init__(self, secret: str, ttl: float = 7 * 24 * 3600):
+        self._key = secret.encode("utf-8")
+        self.ttl = ttl
+
+    def _sign(self, payload: bytes) -> bytes:
+        return _b64(hmac.new(self._key, payload, hashlib.sha256).digest())
+
+    def issue(self, user_id: int) -> str:
+        payload = f"{TOKEN_PREFIX}.{int(user_id)}.{int(time.time() + self.ttl)}.{secrets.token_hex(8)}"
+        return f"{payload}.{self._sign(payload.encode('ascii')).decode('ascii')}"
+
+    def verify(self, token: str) -> Optional[Tuple[int, int, str]]:
+        """Return (user_id, expires, jti) for a valid, unexpired token, else None."""
+        # Tokens we issue are pure ASCII; anything else is garbage, not a server error
+        if not isinstance(token, str) or not token.isascii():
+            return None
+        payload, _, signature = token.encode("ascii").rpartition(b".")
+        if not payload.startswith(TOKEN_PREFIX.encode("ascii") + b".") or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            _, user_id, expires, jti = payload.decode("ascii").split(".")
+            user_id, expires = int(user_id), int(expires)
+        except ValueError:
+            return None
+        if expires <= time.time():
+            return None
+        return user_id, expires, jti
+
+
+class RevocationList:
+    """Ids of logged-out tokens, kept until those tokens expire."""
+
+    def __init__(self, path: Optional[str] = None, refresh_interval: float = 5.0):
+        self._revoked: Dict[str, float] = {}
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    async def revoke(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        if self._conn is not None:
+            await asyncio.to_thread(
+                self._conn.execute, "INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)", (jti, expires_at)
+            )
+
+    def _load(self) -> Dict[str, float]:
+        now = time.time()
+        self._conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,))
+        return dict(self._conn.execute("SELECT jti, expires_at FROM revoked_tokens").fetchall())
+
+    async def refresh(self):
+        now = time.time()
+        if self._conn is not None:
+            self._revoked = await asyncio.to_thread(self._load)
+        else:
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except (sqlite3.Error, httpx.HTTPError) as e:
+                print(f"Could not refresh token revocation list: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class StorageRevocationList(RevocationList):
+    """Revocations in the storage service's revoked_tokens table, shared by every replica.
+
+    Each refresh fetches only the revocations added since the last one seen;
+    a full reload every `full_reload_interval` seconds also picks up any that
+    committed out of id order.
+    """
+
+    def __init__(self, get_client: Callable[[], httpx.AsyncClient], service_key: Optional[str] = None,
+                 refresh_interval: float = 5.0, full_reload_interval: float = 60.0):
+        super().__init__(refresh_interval=refresh_interval)
+        # The pooled storage client is created at startup, so it is looked up per call
+        self._get_client = get_client
+        self._headers = {"X-SERVICE-KEY": service_key} if service_key else {}
+        self.full_reload_interval = full_reload_interval
+        self._last_id = 0
+        self._last_full_reload = 0.0
+
+    async def revoke(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        response = await self._get_client().post(
+            "/revoked-tokens", json={"jti": jti, "expires_at": expires_at}, headers=self._headers
+        )
+        response.raise_for_status()
+
+    async def refresh(self):
+        now = time.time()
+        full = now - self._last_full_reload >= self.full_reload_interval
+        after_id = 0 if full else self._last_id
+        fetched = {}
+        while True:
+            response = await self._get_client().get(
+                "/revoked-tokens", params={"after_id": after_id}, headers=self._headers
+            )
+            response.raise_for_status()
+            page = response.json()
+            for entry in page["revoked"]:
+                fetched[entry["jti"]] = entry["expires_at"]
+                after_id = max(after_id, entry["id"])
+            if not page.get("has_more"):
+                break
+        # A revocation is never undone, so local entries stay until they expire
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._revoked.update(fetched)
+        if full:
+            self._last_full_reload = now
+        self._last_id = after_id
+
+
+def create_revocation_list_from_env(get_storage_client: Callable[[], httpx.AsyncClient],
+                                    service_key: Optional[str] = None) -> RevocationList:
+    """Build the list selected by REVOCATION_STORE (storage, sqlite or memory)."""
+    path = os.getenv("REVOCATION_SQLITE_PATH")
+    kind = os.getenv("REVOCATION_STORE", "sqlite" if path else "memory").lower()
+    refresh_interval = float(os.getenv("REVOCATION_REFRESH_INTERVAL", "5"))
+    if kind == "storage":
+        return StorageRevocationList(get_storage_client, service_key=service_key, refresh_interval=refresh_interval)
+    if kind == "sqlite":
+        return RevocationList(path=path or "gateway_revocations.sqlite3", refresh_interval=refresh_interval)
+    if kind == "memory":
+        return RevocationList(refresh_interval=refresh_interval)
+    raise ValueError(f"Unknown REVOCATION_STORE: {kind}")
@@ -0,0 +1,164 @@
+"""
+Church history content for the gateway's /history endpoints.
+
+The eras and events come from flutter_frontend/assets/data/church_history.json,
+the same file the app ships with. The file is parsed once. Every response body
+is serialized to bytes up front (orjson) with gzip and, when the optional
+`brotli` package is installed, brotli variants, plus a strong ETag. A request
+then costs a dictionary lookup. Clients that send a matching If-None-Match get
+a bodiless 304.
+
+The file is polled for changes every CONTENT_RELOAD_INTERVAL seconds and
+reloaded in a worker thread; the new content replaces the old in one swap.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # Optional: brotli variants are skipped without it
+    brotli = None
+
+DEFAULT_CONTENT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "flutter_frontend", "assets", "data", "church_history.json"
+)
+
+logger = logging.getLogger(__name__)
+
+# Authenticated content: clients may cache it but must revalidate with the ETag
+CACHE_CONTROL = "private, no-cache"
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into {coding: q}; codings with q=0 are refused."""
+    encodings = {}
+    for item in header.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[coding.lower()] = q
+    return encodings
+
+
+class Representation:
+    """One pre-serialized response body with its compressed variants."""
+
+    __slots__ = ("identity", "gzip", "br", "etag")
+
+    def __init__(self, payload):
+        self.identity = orjson.dumps(payload)
+        self.gzip = gzip.compress(self.identity, compresslevel=9)
+        self.br = brotli.compress(self.identity, quality=11) if brotli is not None else None
+        self.etag = '"' + hashlib.sha256(self.identity).hexdigest()[:32] + '"'
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etag in (t.strip() for t in if_none_match.split(","))):
+            return Response(status_code=304, headers=headers)
+
+        accept = accepted_encodings(request.headers.get("accept-encoding", ""))
+        wildcard = accept.get("*", 0.0)
+        candidates = [("br", self.br), ("gzip", self.gzip)] if self.br is not None else [("gzip", self.gzip)]
+        # Highest q wins; on a tie the earlier (smaller) encoding is preferred
+        best_q, best = 0.0, None
+        for coding, data in candidates:
+            q = accept.get(coding, wildcard)
+            if q > best_q:
+                best_q, best = q, (coding, data)
+        if best is not None:
+            headers["Content-Encoding"], body = best
+        else:
+            body = self.identity
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ContentSnapshot:
+    """Parsed eras/events and their pre-built responses for one version of the file."""
+
+    def __init__(self, raw: bytes):
+        data = orjson.loads(raw)
+        self.eras: List[dict] = data.get("eras", [])
+        self.eras_response = Representation({"eras": self.eras})
+        self.era_responses: Dict[str, Representation] = {}
+        self.event_responses: Dict[str, Representation] = {}
+        for era in self.eras:
+            self.era_responses[era["id"]] = Representation({"era": era})
+            for event in era.get("events", []):
+                # First entry wins for repeated ids, matching the search index
+                if event["id"] not in self.event_responses:
+                    self.event_responses[event["id"]] = Representation({"event": event, "era_id": era["id"]})
+
+
+class ContentStore:
+    """Holds the current ContentSnapshot and reloads it when the file changes."""
+
+    def __init__(self, path: str = DEFAULT_CONTENT_PATH, reload_interval: float = 2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.snapshot: Optional[ContentSnapshot] = None
+        self._stamp = None
+        self._task: Optional[asyncio.Task] = None
+        # Called with each new snapshot (e.g. to rebuild derived indexes)
+        self.listeners: List[Callable[[ContentSnapshot], None]] = []
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        stamp = self._file_stamp()
+        with open(self.path, "rb") as f:
+            snapshot = ContentSnapshot(f.read())
+        for listener in self.listeners:
+            listener(snapshot)
+        self.snapshot, self._stamp = snapshot, stamp
+        logger.info("Loaded church history content (%d eras, %d events)", len(snapshot.eras), len(snapshot.event_responses))
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                if self._file_stamp() != self._stamp:
+                    await asyncio.to_thread(self.load)
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the last good content
+                logger.warning("Could not reload church history content: %s", e)
+            except Exception:
+                # A listener choking on a malformed edit must not end hot reload for good
+                logger.exception("Could not reload church history content")
+
+    def start(self):
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Could not load church history content from %s: %s", self.path, e)
+        except Exception:
+            logger.exception("Could not load church history content from %s", self.path)
+        if self.reload_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,20 +1,134 @@
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional
-import uuid
+import asyncio
+import json
 import httpx
 import os
+import secrets
+
+from auth_tokens import StorageRevocationList, TokenSigner, create_revocation_list_from_env
+from content_service import DEFAULT_CONTENT_PATH, ContentSnapshot, ContentStore
+from search_index import EventSearchIndex
+from session_store import create_session_store_from_env
+from write_queue import WriteQueue
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
-STORAGE_URL = "http://localhost:8002"
-LLM_SERVICE_URL = "http://localhost:8001"
-tokens = {}
+STORAGE_URL = os.getenv("STORAGE_URL", "http://localhost:8002")
+LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://localhost:8001")
 # Optional key the gateway will send when persisting memory to storage service.
 STORAGE_SERVICE_KEY = os.getenv("STORAGE_SERVICE_KEY")
 
+# Upstream connection pool settings. One pooled client is kept per upstream for
+# the lifetime of the app so requests reuse keep-alive connections instead of
+# paying a TCP handshake (and an ephemeral port) per call.
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+STORAGE_TIMEOUT = float(os.getenv("STORAGE_TIMEOUT", "10"))
+# Agent graphs can be slow, so the LLM upstream gets a much longer read timeout.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+# HTTP/2 is only used when the optional 'h2' package is installed (httpx[http2]).
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"
+
+storage_client: Optional[httpx.AsyncClient] = None
+llm_client: Optional[httpx.AsyncClient] = None
+
+# Post-chat memory/log persistence runs on a background queue so /chat can
+# respond as soon as the LLM answers. Jobs for one user run in order.
+write_queue = WriteQueue(
+    workers=int(os.getenv("WRITE_QUEUE_WORKERS", "4")),
+    max_size=int(os.getenv("WRITE_QUEUE_MAX_SIZE", "1000")),
+    max_retries=int(os.getenv("WRITE_QUEUE_MAX_RETRIES", "3")),
+)
+
+# Bearer token -> user id. SESSION_STORE=sqlite or storage shares sessions
+# between workers and replicas and keeps them across restarts.
+session_store = create_session_store_from_env(lambda: storage_client, STORAGE_SERVICE_KEY)
+
+# AUTH_TOKEN_MODE=stateless issues HMAC-signed tokens that any gateway process
+# sharing AUTH_TOKEN_SECRET validates without a session lookup.
+AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "session").lower()
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET")
+if AUTH_TOKEN_MODE == "stateless" and not AUTH_TOKEN_SECRET:
+    print("AUTH_TOKEN_SECRET is not set; using a random secret (tokens only valid in this process)")
+    AUTH_TOKEN_SECRET = secrets.token_hex(32)
+token_signer = TokenSigner(AUTH_TOKEN_SECRET or "", ttl=float(os.getenv("SESSION_TTL", str(7 * 24 * 3600))))
+# Logged-out stateless tokens; REVOCATION_STORE=storage shares them with every replica
+revocations = create_revocation_list_from_env(lambda: storage_client, STORAGE_SERVICE_KEY)
+if AUTH_TOKEN_MODE == "stateless" and not isinstance(revocations, StorageRevocationList):
+    print(
+        "WARNING: AUTH_TOKEN_MODE=stateless without REVOCATION_STORE=storage: logout only revokes tokens "
+        + ("on this host" if os.getenv("REVOCATION_SQLITE_PATH") else "in this process")
+        + "; other workers/replicas accept them until they expire"
+    )
+
+# Era/event content from church_history.json, pre-serialized and hot-reloaded
+content_store = ContentStore(
+    path=os.getenv("CHURCH_HISTORY_PATH", DEFAULT_CONTENT_PATH),
+    reload_interval=float(os.getenv("CONTENT_RELOAD_INTERVAL", "2")),
+)
+# Rebuilt from every content snapshot, so search follows hot reloads
+search_index: Optional[EventSearchIndex] = None
+
+
+def _rebuild_search_index(snapshot: ContentSnapshot):
+    global search_index
+    search_index = EventSearchIndex(snapshot.eras)
+
+
+content_store.listeners.append(_rebuild_search_index)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _make_upstream_client(base_url: str, timeout: float) -> httpx.AsyncClient:
+    """Build a pooled keep-alive client for one upstream service."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(timeout, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        http2=UPSTREAM_HTTP2 and _http2_available(),
+    )
+
+
+@app.on_event("startup")
+async def startup_event():
+    global storage_client, llm_client
+    storage_client = _make_upstream_client(STORAGE_URL, STORAGE_TIMEOUT)
+    llm_client = _make_upstream_client(LLM_SERVICE_URL, LLM_TIMEOUT)
+    write_queue.start()
+    content_store.start()
+    if AUTH_TOKEN_MODE == "stateless":
+        revocations.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush pending background writes before the storage client goes away
+    await write_queue.stop()
+    for client in (storage_client, llm_client):
+        if client is not None:
+            await client.aclose()
+    await session_store.close()
+    await revocations.stop()
+    await content_store.stop()
+
 class UserRegister(BaseModel):
     email: EmailStr
     username: str
@@ -27,63 +141,92 @@ class UserLogin(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     patient_id: Optional[str] = None
+    use_cache: Optional[bool] = True  # Set False to force a fresh answer
 
-@app.post("/auth/register")
-async def register(user_data: UserRegister):
-    async with httpx.AsyncClient() as client:
+def _bearer_token(authorization: Optional[str]) -> str:
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header missing")
+    try:
+        return authorization.split(" ")[1]
+    except IndexError:
+        raise HTTPException(status_code=401, detail="Invalid authorization format")
+
+
+async def issue_token(user_id: int) -> str:
+    if AUTH_TOKEN_MODE == "stateless":
+        return token_signer.issue(user_id)
+    return await session_store.create(user_id)
+
+
+async def get_current_user_id(authorization: Optional[str] = Header(None)) -> int:
+    """Auth dependency: the user id for the request's bearer token, or 401."""
+    token = _bearer_token(authorization)
+    if AUTH_TOKEN_MODE == "stateless":
+        claims = token_signer.verify(token)
+        user_id = claims[0] if claims and not revocations.is_revoked(claims[2]) else None
+    else:
         try:
-            response = await client.post(f"{STORAGE_URL}/register", json=user_data.model_dump())
-            if response.status_code == 400:
-                raise HTTPException(status_code=400, detail=response.json().get("detail"))
-            response.raise_for_status()
-            user = response.json()
-            token = f"token_{uuid.uuid4().hex[:16]}"
-            tokens[token] = user["id"]
-            return {"access_token": token, "token_type": "bearer", "user_id": user["id"]}
+            user_id = await session_store.get(token)
         except httpx.HTTPError:
-            raise HTTPException(status_code=500, detail="Storage service unavailable")
+            # SESSION_STORE=storage and the storage service can't answer
+            raise HTTPException(status_code=503, detail="Session store unavailable")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
+
+def _raise_if_storage_busy(response: httpx.Response):
+    """Pass the storage service's sign-in back-pressure (503 + Retry-After) through."""
+    if response.status_code == 503:
+        retry_after = response.headers.get("Retry-After")
+        raise HTTPException(
+            status_code=503,
+            detail=response.json().get("detail", "Service busy, please retry"),
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+
+
+@app.post("/auth/register")
+async def register(user_data: UserRegister):
+    try:
+        response = await storage_client.post("/register", json=user_data.model_dump())
+        if response.status_code == 400:
+            raise HTTPException(status_code=400, detail=response.json().get("detail"))
+        _raise_if_storage_busy(response)
+        response.raise_for_status()
+        user = response.json()
+        token = await issue_token(user["id"])
+        return {"access_token": token, "token_type": "bearer", "user_id": user["id"]}
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Storage service unavailable")
 
 @app.post("/auth/login") 
 async def login(login_data: UserLogin):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(f"{STORAGE_URL}/login", json=login_data.model_dump())
-            if response.status_code == 401:
-                raise HTTPException(status_code=401, detail="Invalid credentials")
-            response.raise_for_status()
-            result = response.json()
-            token = f"token_{uuid.uuid4().hex[:16]}"
-            tokens[token] = result["user_id"]
-            return {"access_token": token, "token_type": "bearer", "user_id": result["user_id"]}
-        except httpx.HTTPError:
-            raise HTTPException(status_code=500, detail="Storage service unavailable")
+    try:
+        response = await storage_client.post("/login", json=login_data.model_dump())
+        if response.status_code == 401:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        _raise_if_storage_busy(response)
+        response.raise_for_status()
+        result = response.json()
+        token = await issue_token(result["user_id"])
+        return {"access_token": token, "token_type": "bearer", "user_id": result["user_id"]}
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Storage service unavailable")
 
 @app.get("/auth/me")
-async def get_current_user(authorization: Optional[str] = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
+async def get_current_user(user_id: int = Depends(get_current_user_id)):
     try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    user_id = tokens.get(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{STORAGE_URL}/me/{user_id}")
-            response.raise_for_status()
-            user_data = response.json()
-            # Do not expose the internal conversation memory to client-side callers.
-            if isinstance(user_data, dict) and 'memory' in user_data:
-                user_data = dict(user_data)  # shallow copy
-                user_data.pop('memory', None)
-            return user_data
-        except httpx.HTTPError:
-            raise HTTPException(status_code=500, detail="Storage service unavailable")
+        response = await storage_client.get(f"/me/{user_id}")
+        response.raise_for_status()
+        user_data = response.json()
+        # Do not expose the internal conversation memory to client-side callers.
+        if isinstance(user_data, dict) and 'memory' in user_data:
+            user_data = dict(user_data)  # shallow copy
+            user_data.pop('memory', None)
+        return user_data
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Storage service unavailable")
 
 @app.post("/auth/logout")
 async def logout(authorization: Optional[str] = Header(None)):
@@ -92,456 +235,338 @@ async def logout(authorization: Optional[str] = Header(None)):
     
     try:
         token = authorization.split(" ")[1]
-        if token in tokens:
-            del tokens[token]
     except IndexError:
-        pass
+        return {"message": "Logout successful"}
+    if AUTH_TOKEN_MODE == "stateless":
+        claims = token_signer.verify(token)
+        if claims:
+            try:
+                await revocations.revoke(claims[2], claims[1])
+            except httpx.HTTPError:
+                raise HTTPException(status_code=503, detail="Revocation store unavailable")
+    else:
+        try:
+            await session_store.delete(token)
+        except httpx.HTTPError:
+            raise HTTPException(status_code=503, detail="Session store unavailable")
     
     return {"message": "Logout successful"}
 
 
 @app.get("/auth/profile")
-async def get_profile(authorization: Optional[str] = Header(None)):
+async def get_profile(user_id: int = Depends(get_current_user_id)):
     """Return the current user's profile (forwarded from storage service)."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
     try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    user_id = tokens.get(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{STORAGE_URL}/me/{user_id}")
-            response.raise_for_status()
-            data = response.json()
-            return {"profile": data.get("profile", {})}
-        except httpx.HTTPError:
-            raise HTTPException(status_code=500, detail="Storage service unavailable")
+        response = await storage_client.get(f"/me/{user_id}")
+        response.raise_for_status()
+        data = response.json()
+        return {"profile": data.get("profile", {})}
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Storage service unavailable")
 
 
 @app.put("/auth/profile")
-async def update_profile(payload: dict, authorization: Optional[str] = Header(None)):
+async def update_profile(payload: dict, user_id: int = Depends(get_current_user_id)):
     """Update the current user's profile by forwarding to storage service."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
     try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    user_id = tokens.get(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        response = await storage_client.put(f"/me/{user_id}/profile", json=payload)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Storage service unavailable")
+
+async def _get_storage_json(path: str, headers: Optional[dict] = None) -> Optional[dict]:
+    """GET a storage resource, returning None on any error or non-200 status."""
+    try:
+        resp = await storage_client.get(path, headers=headers)
+        if resp.status_code == 200:
+            return resp.json()
+    except Exception:
+        pass
+    return None
+
+
+async def load_chat_context(user_id) -> dict:
+    """Fetch the profile, memory and conversation log the LLM needs for a chat.
+
+    Uses the storage service's combined endpoint (one round trip). If that call
+    fails, the three individual resources are fetched concurrently, each falling
+    back to an empty value on its own. Storage being unavailable never blocks
+    the chat.
+    """
+    headers = {"X-SERVICE-KEY": STORAGE_SERVICE_KEY} if STORAGE_SERVICE_KEY else None
+    context = await _get_storage_json(f"/me/{user_id}/chat_context", headers)
+    if context is None:
+        user_info, mem_data, log_data = await asyncio.gather(
+            _get_storage_json(f"/me/{user_id}"),
+            _get_storage_json(f"/me/{user_id}/memory", headers),
+            _get_storage_json(f"/me/{user_id}/conversation_log", headers),
+        )
+        context = {
+            "profile": (user_info or {}).get("profile", {}),
+            "memory": (mem_data or {}).get("memory", ""),
+            "log": (log_data or {}).get("log", "[]"),
+        }
+    return {
+        "profile": context.get("profile") or {},
+        "memory": context.get("memory") or "",
+        "conversation_log": context.get("log") or "[]",
+    }
+
+
+async def enqueue_chat_persistence(user_id, message: str, llm_result: dict):
+    """Queue the post-chat memory and conversation writes for a user.
+
+    Both jobs share the user's queue, so a user's writes are applied in the
+    order their chats finished.
+    """
+    headers = {"X-SERVICE-KEY": STORAGE_SERVICE_KEY} if STORAGE_SERVICE_KEY else None
+
+    new_memory = llm_result.get("memory")
+    if new_memory:
+        async def write_memory():
+            resp = await storage_client.put(f"/me/{user_id}/memory", json={"memory": new_memory}, headers=headers)
+            resp.raise_for_status()
+
+        await write_queue.submit(user_id, write_memory, f"memory for user {user_id}")
+
+    llm_log = llm_result.get("conversation_log")
+
+    async def write_log():
+        if llm_log:
+            # The LLM returned an authoritative conversation_log, replace the stored turns with it
+            payload_log = json.dumps(llm_log) if isinstance(llm_log, dict) else llm_log
+            resp = await storage_client.put(f"/me/{user_id}/conversation_log", json={"log": payload_log}, headers=headers)
+        else:
+            # Append this exchange; the stored conversation is never read back or rewritten
+            final_resp = llm_result.get("response") or llm_result.get("final_response") or ""
+            turns = [{"role": "user", "text": message}, {"role": "assistant", "text": final_resp}]
+            resp = await storage_client.post(f"/me/{user_id}/conversation_turns", json={"turns": turns}, headers=headers)
+            if resp.status_code == 404:
+                return
+        resp.raise_for_status()
+
+    await write_queue.submit(user_id, write_log, f"conversation log for user {user_id}")
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.put(f"{STORAGE_URL}/me/{user_id}/profile", json=payload)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError:
-            raise HTTPException(status_code=500, detail="Storage service unavailable")
 
 @app.post("/chat")
-async def chat_with_agent(chat_data: ChatRequest, authorization: Optional[str] = Header(None)):
+async def chat_with_agent(chat_data: ChatRequest, user_id: int = Depends(get_current_user_id)):
     """
     Protected endpoint to chat with the LLM agent graph (now Church History AI).
     Requires authentication token and forwards user message to LLM service.
     """
-    # Extract and validate token
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    user_id = tokens.get(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     llm_payload = {
         "message": chat_data.message,
         "user_id": str(user_id),
-        "patient_id": chat_data.patient_id  # Reserved for future use
+        "patient_id": chat_data.patient_id,  # Reserved for future use
+        "use_cache": chat_data.use_cache,
     }
-    # Try to fetch the user's profile and conversation memory from the storage service
+    # Load the user's profile, memory and conversation log from the storage service
+    llm_payload.update(await load_chat_context(user_id))
+
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{STORAGE_URL}/me/{user_id}")
-            if resp.status_code == 200:
-                user_info = resp.json()
-                llm_payload["profile"] = user_info.get("profile", {})
-            else:
-                llm_payload["profile"] = {}
-
-            # Fetch memory separately (use service key if configured)
-            headers = {"X-SERVICE-KEY": STORAGE_SERVICE_KEY} if STORAGE_SERVICE_KEY else None
-            if headers:
-                mem_resp = await client.get(f"{STORAGE_URL}/me/{user_id}/memory", headers=headers)
-            else:
-                mem_resp = await client.get(f"{STORAGE_URL}/me/{user_id}/memory")
-
-            if mem_resp.status_code == 200:
-                mem_data = mem_resp.json()
-                llm_payload["memory"] = mem_data.get("memory", "")
-            else:
-                llm_payload["memory"] = ""
-            # Fetch recent conversation log (use service key if configured)
-            if headers:
-                log_resp = await client.get(f"{STORAGE_URL}/me/{user_id}/conversation_log", headers=headers)
-            else:
-                log_resp = await client.get(f"{STORAGE_URL}/me/{user_id}/conversation_log")
-
-            if log_resp.status_code == 200:
-                log_data = log_resp.json()
-                llm_payload["conversation_log"] = log_data.get("log", "[]")
-            else:
-                llm_payload["conversation_log"] = "[]"
-    except Exception:
-        # If storage is unavailable or any error occurs, continue without profile/memory
-        llm_payload["profile"] = {}
-        llm_payload["memory"] = ""
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            # Forward the request to the LLM Service
-            # Use a long timeout, as agent graphs can be slow
-            response = await client.post(
-                f"{LLM_SERVICE_URL}/api/v1/invoke_agent_graph", 
-                json=llm_payload,
-                timeout=300.0 
+        # Forward the request to the LLM Service (the LLM client carries the long timeout)
+        response = await llm_client.post("/api/v1/invoke_agent_graph", json=llm_payload)
+
+        # Propagate errors from the LLM service
+        response.raise_for_status()
+
+        llm_result = response.json()
+
+        # Persist memory and the conversation log in the background
+        await enqueue_chat_persistence(user_id, chat_data.message, llm_result)
+
+        # Return the LLM's final response to the Flutter app
+        return llm_result
+
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail="LLM service is unavailable")
+    except httpx.ReadTimeout:
+        raise HTTPException(status_code=504, detail="Request to LLM service timed out")
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code in (429, 503):
+            # The LLM service is shedding load; pass the back-off hint through
+            retry_after = e.response.headers.get("Retry-After")
+            raise HTTPException(
+                status_code=e.response.status_code,
+                detail=e.response.json().get("detail", "LLM service is busy"),
+                headers={"Retry-After": retry_after} if retry_after else None,
             )
-            
-            # Propagate errors from the LLM service
-            response.raise_for_status() 
-            
-            llm_result = response.json()
+        if e.response.status_code != 500:
+            try:
+                return e.response.json()
+            except:
+                raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+        raise HTTPException(status_code=500, detail="An error occurred in the LLM service")
+
 
-            # Persist updated memory if the LLM returned one
+def _upstream_http_error(response: httpx.Response) -> HTTPException:
+    """Relay an LLM service error response: its `detail` and any Retry-After hint."""
+    try:
+        detail = response.json()["detail"]
+    except (ValueError, KeyError, TypeError):
+        # Not a FastAPI JSON error body; fall back to the raw text
+        detail = response.text or "An error occurred in the LLM service"
+    retry_after = response.headers.get("Retry-After")
+    return HTTPException(
+        status_code=response.status_code,
+        detail=detail,
+        headers={"Retry-After": retry_after} if retry_after else None,
+    )
+
+
+def _parse_sse_done(buffer: str):
+    """Split complete SSE events off `buffer`, returning (done_payload, remainder).
+
+    `done_payload` is the decoded data of a `done` event if one was completed,
+    otherwise None.
+    """
+    done = None
+    while "\n\n" in buffer:
+        raw_event, buffer = buffer.split("\n\n", 1)
+        lines = raw_event.splitlines()
+        if "event: done" in lines:
+            data = "".join(line[len("data: "):] for line in lines if line.startswith("data: "))
             try:
-                new_memory = llm_result.get("memory")
-                if new_memory:
-                    async with httpx.AsyncClient() as client2:
-                        headers = {"X-SERVICE-KEY": STORAGE_SERVICE_KEY} if STORAGE_SERVICE_KEY else None
-                        if headers:
-                            await client2.put(f"{STORAGE_URL}/me/{user_id}/memory", json={"memory": new_memory}, headers=headers)
-                        else:
-                            await client2.put(f"{STORAGE_URL}/me/{user_id}/memory", json={"memory": new_memory})
-
-                # If the LLM returned an authoritative conversation_log, persist it directly
-                try:
-                    async with httpx.AsyncClient() as client2:
-                        headers = {"X-SERVICE-KEY": STORAGE_SERVICE_KEY} if STORAGE_SERVICE_KEY else None
-                        llm_log = llm_result.get("conversation_log")
-                        import json as _json
-                        if llm_log:
-                            if isinstance(llm_log, dict):
-                                payload_log = _json.dumps(llm_log)
-                            else:
-                                payload_log = llm_log
-                            if headers:
-                                await client2.put(f"{STORAGE_URL}/me/{user_id}/conversation_log", json={"log": payload_log}, headers=headers)
-                            else:
-                                await client2.put(f"{STORAGE_URL}/me/{user_id}/conversation_log", json={"log": payload_log})
-                        else:
-                            # Fallback: append current exchange to stored log
-                            final_resp = llm_result.get("response") or llm_result.get("final_response") or ""
-                            if headers:
-                                existing = await client2.get(f"{STORAGE_URL}/me/{user_id}/conversation_log", headers=headers)
-                            else:
-                                existing = await client2.get(f"{STORAGE_URL}/me/{user_id}/conversation_log")
-                            if existing.status_code == 200:
-                                log_json = existing.json().get("log", "[]")
-                            else:
-                                log_json = "[]"
-                            try:
-                                parsed = _json.loads(log_json)
-                                if isinstance(parsed, dict):
-                                    recent_user = parsed.get("recent_user_prompts", []) or []
-                                    recent_assistant = parsed.get("recent_assistant_responses", []) or []
-                                elif isinstance(parsed, list):
-                                    recent_user = [e.get("text") for e in parsed if isinstance(e, dict) and e.get("role") == "user"][-5:]
-                                    recent_assistant = [e.get("text") for e in parsed if isinstance(e, dict) and e.get("role") == "assistant"][-5:]
-                                else:
-                                    recent_user = []
-                                    recent_assistant = []
-                            except Exception:
-                                recent_user = []
-                                recent_assistant = []
-                            recent_user.append(chat_data.message)
-                            recent_user = recent_user[-5:]
-                            recent_assistant.append(final_resp)
-                            recent_assistant = recent_assistant[-5:]
-                            new_log_obj = {"recent_user_prompts": recent_user, "recent_assistant_responses": recent_assistant}
-                            if headers:
-                                await client2.put(f"{STORAGE_URL}/me/{user_id}/conversation_log", json={"log": _json.dumps(new_log_obj)}, headers=headers)
-                            else:
-                                await client2.put(f"{STORAGE_URL}/me/{user_id}/conversation_log", json={"log": _json.dumps(new_log_obj)})
-                except Exception:
-                    pass
-            except Exception:
+                done = json.loads(data)
+            except ValueError:
                 pass
+    return done, buffer
+
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(chat_data: ChatRequest, user_id: int = Depends(get_current_user_id)):
+    """
+    Streaming variant of /chat.
+    Relays the LLM service's server-sent events (`token` chunks, then a final
+    `done` event) to the client as they arrive, without buffering the answer.
+    """
+    llm_payload = {
+        "message": chat_data.message,
+        "user_id": str(user_id),
+        "patient_id": chat_data.patient_id,  # Reserved for future use
+        "use_cache": chat_data.use_cache,
+    }
+    llm_payload.update(await load_chat_context(user_id))
 
-            # Return the LLM's final response to the Flutter app
-            return llm_result
-        
-        except httpx.ConnectError:
-            raise HTTPException(status_code=503, detail="LLM service is unavailable")
-        except httpx.ReadTimeout:
-            raise HTTPException(status_code=504, detail="Request to LLM service timed out")
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code != 500:
-                try:
-                    return e.response.json()
-                except:
-                    raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
-            raise HTTPException(status_code=500, detail="An error occurred in the LLM service")
+    # Open the upstream stream before responding so connection errors still
+    # surface as proper HTTP errors.
+    try:
+        upstream = await llm_client.send(
+            llm_client.build_request("POST", "/api/v1/invoke_agent_graph/stream", json=llm_payload),
+            stream=True,
+        )
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail="LLM service is unavailable")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Request to LLM service timed out")
+    if upstream.status_code != 200:
+        await upstream.aread()
+        await upstream.aclose()
+        raise _upstream_http_error(upstream)
+
+    async def relay():
+        buffer = ""
+        llm_result = None
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+                # Watch for the final event so the exchange can be persisted
+                if llm_result is None:
+                    buffer += chunk.decode("utf-8", errors="ignore")
+                    llm_result, buffer = _parse_sse_done(buffer)
+        except httpx.HTTPError as e:
+            print(f"LLM stream for user {user_id} ended early: {e}")
+        finally:
+            await upstream.aclose()
+        if llm_result is not None:
+            await enqueue_chat_persistence(user_id, chat_data.message, llm_result)
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ============================================================================
 # Church History API Endpoints
 # ============================================================================
 
-@app.get("/history/eras")
-async def get_all_eras(authorization: Optional[str] = Header(None)):
+def _content() -> ContentSnapshot:
+    if content_store.snapshot is None:
+        raise HTTPException(status_code=503, detail="Church history content unavailable")
+    return content_store.snapshot
+
+
+@app.get("/history/eras", dependencies=[Depends(get_current_user_id)])
+async def get_all_eras(request: Request):
     """Get all church history eras with their events."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    # For now, return sample data. In production, fetch from storage service.
-    sample_eras = {
-        "eras": [
-            {
-                "id": "early_church",
-                "title": "Early Church Period",
-                "start_year": "33 AD",
-                "end_year": "325 AD",
-                "description": "From Jesus's resurrection through the Council of Nicaea, establishing foundational Christian beliefs and practices.",
-                "color": "#FF6B6B",
-                "icon": "cross",
-                "events": []
-            },
-            {
-                "id": "medieval",
-                "title": "Medieval Period",
-                "start_year": "325 AD",
-                "end_year": "1517 AD",
-                "description": "The Middle Ages saw the development of monasticism, the split between East and West, and the building of great cathedrals.",
-                "color": "#4ECDC4",
-                "icon": "castle",
-                "events": []
-            },
-            {
-                "id": "reformation",
-                "title": "Reformation",
-                "start_year": "1517 AD",
-                "end_year": "1700 AD",
-                "description": "Martin Luther's reforms and the Counter-Reformation transformed Christianity and led to the emergence of Protestantism.",
-                "color": "#FFE66D",
-                "icon": "book",
-                "events": []
-            },
-            {
-                "id": "modern",
-                "title": "Modern Era",
-                "start_year": "1700 AD",
-                "end_year": "Present",
-                "description": "From the Enlightenment to today, Christianity has adapted to modernization, global expansion, and theological shifts.",
-                "color": "#95E1D3",
-                "icon": "globe",
-                "events": []
-            }
-        ]
-    }
-    
-    return sample_eras
+    return _content().eras_response.response(request)
 
 
-@app.get("/history/eras/{era_id}")
-async def get_era(era_id: str, authorization: Optional[str] = Header(None)):
+@app.get("/history/eras/{era_id}", dependencies=[Depends(get_current_user_id)])
+async def get_era(era_id: str, request: Request):
     """Get a specific era with all its events."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    # Sample era data with events
-    eras_data = {
-        "early_church": {
-            "id": "early_church",
-            "title": "Early Church Period",
-            "start_year": "33 AD",
-            "end_year": "325 AD",
-            "description": "From Jesus's resurrection through the Council of Nicaea",
-            "color": "#FF6B6B",
-            "icon": "cross",
-            "events": [
-                {
-                    "id": "pentecost",
-                    "title": "Day of Pentecost",
-                    "year": "33 AD",
-                    "location": "Jerusalem",
-                    "description": "The Holy Spirit descended upon Jesus's apostles, marking the birth of the Christian church.",
-                    "details": "On the Jewish feast of Pentecost, approximately 50 days after Jesus's resurrection, about 120 believers gathered in Jerusalem. The Holy Spirit came upon them with the sound of a mighty rushing wind and appeared as divided tongues of fire. Peter delivered a powerful sermon that resulted in about 3,000 people converting to Christianity.",
-                    "key_figures": ["Peter", "John", "James", "Mary (Mother of Jesus)"],
-                    "significance": ["Established the Christian church as a distinct faith community", "Demonstrated the power of the Holy Spirit", "Marked the beginning of Christian evangelism", "Empowered believers to spread the Gospel"],
-                    "tags": ["Church Founding", "Holy Spirit", "Apostles", "Jerusalem"]
-                },
-                {
-                    "id": "councils_nicaea",
-                    "title": "Council of Nicaea",
-                    "year": "325 AD",
-                    "location": "Nicaea (modern-day Turkey)",
-                    "description": "The first ecumenical council of the Christian church, convened to address theological disputes.",
-                    "details": "Emperor Constantine I convened approximately 300 bishops from across the Roman Empire to address the Arian controversy, which questioned the divine nature of Christ. The council resulted in the Nicene Creed, which affirmed the consubstantiality (same substance) of the Father and the Son, establishing orthodox Christian doctrine.",
-                    "key_figures": ["Constantine I", "Athanasius of Alexandria", "Nicholas of Myra", "Eusebius of Caesarea"],
-                    "significance": ["Established the Nicene Creed as a standard of Christian orthodoxy", "Addressed major theological disputes", "Demonstrated the power of imperial authority in church matters", "Set precedent for ecumenical councils"],
-                    "tags": ["Councils", "Theology", "Constantine", "Creed"]
-                },
-                {
-                    "id": "persecution_nero",
-                    "title": "Persecution Under Nero",
-                    "year": "64-68 AD",
-                    "location": "Rome",
-                    "description": "Roman Emperor Nero blamed Christians for the great fire of Rome and persecuted them severely.",
-                    "details": "After a massive fire destroyed much of Rome in 64 AD, Nero blamed the Christians and initiated severe persecution. Early Christian traditions report that both Peter and Paul were martyred during this period. Nero used Christians as scapegoats and had many crucified or burned alive, making them public spectacles.",
-                    "key_figures": ["Nero", "Peter", "Paul", "Linus"],
-                    "significance": ["First recorded large-scale persecution of Christians", "Demonstrated the willingness of believers to suffer for their faith", "Established the concept of Christian martyrdom", "Led to the spread of Christianity despite opposition"],
-                    "tags": ["Persecution", "Martyrdom", "Rome", "Early Believers"]
-                },
-                {
-                    "id": "epistle_paul",
-                    "title": "Paul's Epistles Written",
-                    "year": "50-67 AD",
-                    "location": "Various locations",
-                    "description": "The Apostle Paul wrote his influential letters to early Christian communities across the Mediterranean.",
-                    "details": "Paul's letters, the oldest surviving Christian documents, were written to various churches and individuals between approximately 50-67 AD. His epistles address theological issues, provide pastoral guidance, and explain Christian doctrine. These letters form a significant portion of the New Testament and profoundly shaped Christian theology and practice.",
-                    "key_figures": ["Paul", "Silas", "Timothy", "Titus"],
-                    "significance": ["Provided theological foundation for Christian doctrine", "Addressed practical issues in early churches", "Influenced Christian ethics and community life", "Became core texts of the New Testament"],
-                    "tags": ["New Testament", "Theology", "Apostolic Letters", "Paul"]
-                },
-                {
-                    "id": "gospels_written",
-                    "title": "Writing of the Four Gospels",
-                    "year": "70-100 AD",
-                    "location": "Various locations",
-                    "description": "The four canonical gospels were written, recording Jesus's life, ministry, death, and resurrection.",
-                    "details": "The gospels of Matthew, Mark, Luke, and John were written over several decades, likely between 70-100 AD. These narratives provide the primary accounts of Jesus's teachings and works. Each gospel has a distinct perspective and was written for different audiences within the early Christian communities.",
-                    "key_figures": ["Matthew", "Mark", "Luke", "John"],
-                    "significance": ["Preserved the teachings and life of Jesus", "Became the foundation of Christian faith and practice", "Provide different perspectives on Jesus's ministry", "Form the core of Christian scripture"],
-                    "tags": ["New Testament", "Scripture", "Jesus", "Gospels"]
-                }
-            ]
-        }
-    }
-    
-    if era_id in eras_data:
-        return {"era": eras_data[era_id]}
-    else:
+    representation = _content().era_responses.get(era_id)
+    if representation is None:
         raise HTTPException(status_code=404, detail="Era not found")
+    return representation.response(request)
 
 
-@app.get("/history/events/{event_id}")
-async def get_event(event_id: str, authorization: Optional[str] = Header(None)):
+@app.get("/history/events/{event_id}", dependencies=[Depends(get_current_user_id)])
+async def get_event(event_id: str, request: Request):
     """Get a specific historical event."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    raise HTTPException(status_code=404, detail="Event not found")
+    representation = _content().event_responses.get(event_id)
+    if representation is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return representation.response(request)
 
 
-@app.post("/history/events/{event_id}/viewed")
-async def mark_event_viewed(event_id: str, authorization: Optional[str] = Header(None)):
+@app.post("/history/events/{event_id}/viewed", dependencies=[Depends(get_current_user_id)])
+async def mark_event_viewed(event_id: str):
     """Mark an event as viewed for learning progress tracking."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     return {"status": "Event marked as viewed"}
 
 
-@app.post("/history/events/{event_id}/bookmark")
-async def bookmark_event(event_id: str, authorization: Optional[str] = Header(None)):
+@app.post("/history/events/{event_id}/bookmark", dependencies=[Depends(get_current_user_id)])
+async def bookmark_event(event_id: str):
     """Bookmark an event for later reference."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     return {"status": "Event bookmarked"}
 
 
-@app.post("/history/events/{event_id}/unbookmark")
-async def unbookmark_event(event_id: str, authorization: Optional[str] = Header(None)):
+@app.post("/history/events/{event_id}/unbookmark", dependencies=[Depends(get_current_user_id)])
+async def unbookmark_event(event_id: str):
     """Remove an event from bookmarks."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     return {"status": "Bookmark removed"}
 
 
-@app.get("/history/search")
-async def search_events(q: str, authorization: Optional[str] = Header(None)):
-    """Search for church history events."""
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization header missing")
-    
-    try:
-        token = authorization.split(" ")[1]
-    except IndexError:
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    if token not in tokens:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    return {"events": []}
+@app.get("/history/search", dependencies=[Depends(get_current_user_id)])
+async def search_events(
+    q: str = "",
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+):
+    """Search for church history events.
+
+    `q` matches titles, descriptions, details, key figures, tags and locations
+    (all terms must match). `year_from`/`year_to` keep events whose years
+    overlap the range (BC years are negative).
+    """
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Church history content unavailable")
+    total, events = search_index.search(q, year_from, year_to, offset=(page - 1) * page_size, limit=page_size)
+    return {"events": events, "total": total, "page": page, "page_size": page_size}
+
+
+@app.get("/history/search/suggest", dependencies=[Depends(get_current_user_id)])
+async def suggest_search_terms(prefix: str, limit: int = Query(10, ge=1, le=50)):
+    """Autocomplete figures, tags, locations and event titles by prefix."""
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Church history content unavailable")
+    return {"suggestions": search_index.suggest(prefix, limit)}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,186 @@
+"""
+Event search over the church history content.
+
+Built once per content snapshot (and rebuilt on hot reload):
+
+- term postings: term -> {event: weight} over title, description, details,
+  keyFigures, tags and location, with weights favouring the short, specific
+  fields (a hit in keyFigures counts more than one in details)
+- a year-interval index: events sorted by start year, parsed from strings like
+  "64-68 AD", "1536–1541 AD" or "1940-Present"
+- a sorted suggestion list for prefix autocomplete on figures, tags, locations
+  and titles
+
+A query intersects the postings of its terms, smallest first, and filters by
+year with a bisect over the sorted starts. Its cost grows with the number of
+matches, not with the size of the dataset.
+"""
+
+import bisect
+import datetime
+import re
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+YEAR_RE = re.compile(r"(\d+|present)\s*(bc|bce|ad|ce)?", re.IGNORECASE)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or that the their this to was were with".split()
+)
+
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "keyFigures": 3.0,
+    "tags": 3.0,
+    "location": 2.0,
+    "description": 1.0,
+    "details": 0.5,
+}
+
+SUGGEST_FIELDS = ("keyFigures", "tags", "location", "title")
+
+
+def fold_term(word: str) -> str:
+    """Cheap plural folding so "councils" and "council" share a posting.
+
+    Mirrors llm_service/app/text_utils.tokenize; both services are deployed
+    separately, so the rule is kept in step by hand.
+    """
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms with stopwords removed, plural-folded; used for documents and queries."""
+    return [fold_term(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def parse_year_range(text: str) -> Optional[Tuple[int, int]]:
+    """Parse "64-68 AD" style strings into (start, end); BC years are negative."""
+    years = []
+    matches = YEAR_RE.findall(text or "")
+    # An era marker after the last number ("46-68 AD") applies to the whole range
+    trailing_era = (matches[-1][1] if matches else "").lower()
+    for number, era in matches:
+        if number.lower() == "present":
+            years.append(datetime.date.today().year)
+            continue
+        year = int(number)
+        if (era or trailing_era).lower() in ("bc", "bce"):
+            year = -year
+        years.append(year)
+    if not years:
+        return None
+    return min(years[0], years[-1]), max(years[0], years[-1])
+
+
+def _field_text(value) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+class EventSearchIndex:
+    """Inverted index, year-interval index and autocomplete over events."""
+
+    def __init__(self, eras: List[dict]):
+        self.events: List[dict] = []
+        self.postings: Dict[str, Dict[int, float]] = {}
+        intervals = []
+        suggestions = {}
+        seen_ids = set()
+
+        for era in eras:
+            for event in era.get("events", []):
+                # The dataset repeats a few events; index each id once (first entry wins)
+                if event["id"] in seen_ids:
+                    continue
+                seen_ids.add(event["id"])
+                doc = len(self.events)
+                self.events.append({
+                    "id": event["id"],
+                    "era_id": era["id"],
+                    "title": event.get("title"),
+                    "year": event.get("year"),
+                    "location": event.get("location"),
+                    "description": event.get("description"),
+                })
+                for field, weight in FIELD_WEIGHTS.items():
+                    for term in tokenize(_field_text(event.get(field))):
+                        postings = self.postings.setdefault(term, {})
+                        postings[doc] = postings.get(doc, 0.0) + weight
+
+                years = parse_year_range(event.get("year", ""))
+                if years:
+                    intervals.append((years[0], years[1], doc))
+
+                for field in SUGGEST_FIELDS:
+                    values = event.get(field)
+                    for value in values if isinstance(values, list) else [values]:
+                        if not value:
+                            continue
+                        # Match from the start of any word ("hippo" finds "Augustine of Hippo")
+                        words = value.lower().split()
+                        for i in range(len(words)):
+                            key = " ".join(words[i:])
+                            count, display = suggestions.get(key, (0, value))
+                            suggestions[key] = (count + 1, display)
+
+        intervals.sort()
+        self._starts = [start for start, _, _ in intervals]
+        self._intervals = intervals
+        # Every event in chronological order; events without a parseable year go last
+        dated = {doc for _, _, doc in intervals}
+        self._chronological = [doc for _, _, doc in intervals] + [
+            doc for doc in range(len(self.events)) if doc not in dated
+        ]
+        self._suggest_keys = sorted(suggestions)
+        self._suggestions = suggestions
+
+    def _year_filter(self, year_from: Optional[int], year_to: Optional[int]) -> Optional[set]:
+        if year_from is None and year_to is None:
+            return None
+        # Events overlapping [year_from, year_to]: start <= year_to and end >= year_from
+        stop = len(self._intervals) if year_to is None else bisect.bisect_right(self._starts, year_to)
+        return {
+            doc for _, end, doc in self._intervals[:stop]
+            if year_from is None or end >= year_from
+        }
+
+    def search(self, query: str = "", year_from: Optional[int] = None, year_to: Optional[int] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[int, List[dict]]:
+        """Return (total matches, one page of event summaries)."""
+        terms = list(dict.fromkeys(tokenize(query or "")))
+        in_years = self._year_filter(year_from, year_to)
+
+        if terms:
+            lists = sorted((self.postings.get(term, {}) for term in terms), key=len)
+            if not lists[0]:
+                return 0, []
+            scores = {
+                doc: sum(p[doc] for p in lists)
+                for doc in lists[0]
+                if all(doc in p for p in lists[1:]) and (in_years is None or doc in in_years)
+            }
+            ranked = sorted(scores, key=lambda doc: (-scores[doc], doc))
+        elif in_years is not None:
+            # Year-only search: chronological order
+            ranked = [doc for _, _, doc in self._intervals if doc in in_years]
+        else:
+            ranked = self._chronological
+
+        return len(ranked), [self.events[doc] for doc in ranked[offset:offset + limit]]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """Figures, tags, locations and titles with a word starting with `prefix`."""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._suggest_keys, prefix)
+        end = bisect.bisect_left(self._suggest_keys, prefix + "\uffff")
+        best = {}
+        for key in self._suggest_keys[start:end]:
+            count, display = self._suggestions[key]
+            best[display] = max(best.get(display, 0), count)
+        return sorted(best, key=lambda d: (-best[d], d))[:limit]
@@ -0,0 +1,203 @@
+"""
+Session stores for the API gateway.
+
+A session maps an opaque bearer token to a user id. When sessions live only in
+one process's memory, the gateway can't run with several workers or replicas,
+and a restart logs everyone out. Available stores:
+
+- MemorySessionStore: in-process LRU with a TTL (single worker only)
+- SQLiteSessionStore: a SQLite file shared by the workers on one host
+- StorageSessionStore: the storage service's sessions table (any number of replicas)
+
+Shared stores are wrapped in CachedSessionStore. It keeps hot tokens in a
+small local LRU, so validating them needs no I/O. Cached entries live for at
+most SESSION_CACHE_TTL seconds, which bounds how long a logout made through
+another worker can go unnoticed.
+"""
+
+import asyncio
+import os
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import httpx
+
+
+def new_token() -> str:
+    return f"token_{secrets.token_hex(16)}"
+
+
+class SessionStore:
+    """Interface: create, look up and delete sessions by token."""
+
+    async def create(self, user_id: int) -> str:
+        raise NotImplementedError
+
+    async def get(self, token: str) -> Optional[int]:
+        raise NotImplementedError
+
+    async def delete(self, token: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU of token -> (user_id, expires_at)."""
+
+    def __init__(self, max_entries: int = 100_000, ttl: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def put(self, token: str, user_id: int, ttl: Optional[float] = None):
+        self._entries[token] = (user_id, time.time() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, token: str) -> Optional[int]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return user_id
+
+    def discard(self, token: str):
+        self._entries.pop(token, None)
+
+    async def create(self, user_id: int) -> str:
+        token = new_token()
+        self.put(token, user_id)
+        return token
+
+    async def get(self, token: str) -> Optional[int]:
+        return self.lookup(token)
+
+    async def delete(self, token: str):
+        self.discard(token)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file, shared by every gateway worker on the host."""
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, user_id INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+        self._lock = asyncio.Lock()
+
+    async def _execute(self, sql: str, params=()):
+        async with self._lock:
+            return await asyncio.to_thread(lambda: self._conn.execute(sql, params).fetchone())
+
+    async def create(self, user_id: int) -> str:
+        token = new_token()
+        now = time.time()
+        await self._execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        await self._execute("INSERT INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)", (token, user_id, now + self.ttl))
+        return token
+
+    async def get(self, token: str) -> Optional[int]:
+        row = await self._execute("SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?", (token, time.time()))
+        return row[0] if row else None
+
+    async def delete(self, token: str):
+        await self._execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    async def close(self):
+        self._conn.close()
+
+
+class StorageSessionStore(SessionStore):
+    """Sessions in the storage service's sessions table."""
+
+    def __init__(self, get_client: Callable[[], httpx.AsyncClient], service_key: Optional[str] = None, ttl: float = 7 * 24 * 3600):
+        # The pooled storage client is created at startup, so it is looked up per call
+        self._get_client = get_client
+        self._headers = {"X-SERVICE-KEY": service_key} if service_key else {}
+        self.ttl = ttl
+
+    async def create(self, user_id: int) -> str:
+        response = await self._get_client().post(
+            "/sessions", json={"user_id": user_id, "ttl_seconds": int(self.ttl)}, headers=self._headers
+        )
+        response.raise_for_status()
+        return response.json()["token"]
+
+    async def get(self, token: str) -> Optional[int]:
+        response = await self._get_client().get(f"/sessions/{token}", headers=self._headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["user_id"]
+
+    async def delete(self, token: str):
+        response = await self._get_client().delete(f"/sessions/{token}", headers=self._headers)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+
+class CachedSessionStore(SessionStore):
+    """A shared store fronted by a short-lived local LRU of hot tokens."""
+
+    def __init__(self, backend: SessionStore, cache_ttl: float = 30.0, cache_size: int = 10_000):
+        self.backend = backend
+        self.cache = MemorySessionStore(max_entries=cache_size, ttl=cache_ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def create(self, user_id: int) -> str:
+        token = await self.backend.create(user_id)
+        self.cache.put(token, user_id)
+        return token
+
+    async def get(self, token: str) -> Optional[int]:
+        user_id = self.cache.lookup(token)
+        if user_id is not None:
+            self.hits += 1
+            return user_id
+        self.misses += 1
+        user_id = await self.backend.get(token)
+        if user_id is not None:
+            self.cache.put(token, user_id)
+        return user_id
+
+    async def delete(self, token: str):
+        self.cache.discard(token)
+        await self.backend.delete(token)
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_session_store_from_env(get_storage_client: Callable[[], httpx.AsyncClient], service_key: Optional[str] = None) -> SessionStore:
+    """Build the store selected by SESSION_STORE (memory, sqlite or storage)."""
+    kind = os.getenv("SESSION_STORE", "memory").lower()
+    ttl = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+    if kind == "memory":
+        return MemorySessionStore(max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "100000")), ttl=ttl)
+    if kind == "sqlite":
+        backend = SQLiteSessionStore(os.getenv("SESSION_SQLITE_PATH", "gateway_sessions.sqlite3"), ttl=ttl)
+    elif kind == "storage":
+        backend = StorageSessionStore(get_storage_client, service_key=service_key, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown SESSION_STORE: {kind}")
+    return CachedSessionStore(
+        backend,
+        cache_ttl=float(os.getenv("SESSION_CACHE_TTL", "30")),
+        cache_size=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    )
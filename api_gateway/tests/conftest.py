@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The gateway modules import each other as top-level modules (uvicorn runs from api_gateway/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """The gateway app module in stateless token mode, with no startup events run."""
+    import main_simple
+
+    monkeypatch.setattr(main_simple, "AUTH_TOKEN_MODE", "stateless")
+    return main_simple
+
+
+@pytest.fixture
+def client(gateway):
+    from fastapi.testclient import TestClient
+
+    # Not used as a context manager, so the upstream clients are never started
+    return TestClient(gateway.app)
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from auth_tokens import TokenSigner
+
+GARBAGE_TOKENS = [
+    "st1.é.1.2.sig",
+    "st1.1.9999999999.abcd.sïgnature",
+    "st1.1.2.3",
+    "not-a-token",
+    "st1....",
+    "",
+]
+
+
+def test_issued_token_verifies():
+    signer = TokenSigner("secret", ttl=60)
+    user_id, expires, jti = signer.verify(signer.issue(42))
+    assert user_id == 42
+    assert expires > time.time()
+    assert jti
+
+
+def test_tampered_or_foreign_token_is_rejected():
+    token = TokenSigner("secret", ttl=60).issue(42)
+    assert TokenSigner("other-secret").verify(token) is None
+    assert TokenSigner("secret").verify(token.replace("st1.42.", "st1.43.")) is None
+
+
+@pytest.mark.parametrize("token", GARBAGE_TOKENS)
+def test_garbage_token_is_rejected(token):
+    assert TokenSigner("secret").verify(token) is None
+
+
+@pytest.mark.parametrize("token", ["st1.é.1.2.sig", "st1.1.9999999999.abcd.sïgnature", "garbage"])
+def test_gateway_answers_401_for_garbage_token(client, token):
+    # httpx sends bytes verbatim; Starlette decodes header values as latin-1
+    headers = {"Authorization": b"Bearer " + token.encode("utf-8")}
+    assert client.get("/auth/me", headers=headers).status_code == 401
+    assert client.post("/auth/logout", headers=headers).status_code == 200
@@ -0,0 +1,42 @@
+import httpx
+import pytest
+
+
+def _mock_client(handler, base_url):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url=base_url)
+
+
+@pytest.fixture
+def llm_responds(gateway, monkeypatch):
+    """Point the gateway at a fake LLM service that answers every call with `response`."""
+
+    def install(response: httpx.Response):
+        # Storage is down: chat context falls back to empty values
+        monkeypatch.setattr(gateway, "storage_client", _mock_client(lambda request: httpx.Response(503), "http://storage"))
+        monkeypatch.setattr(gateway, "llm_client", _mock_client(lambda request: response, "http://llm"))
+
+    return install
+
+
+def _auth(gateway):
+    return {"Authorization": f"Bearer {gateway.token_signer.issue(7)}"}
+
+
+def test_stream_relays_upstream_json_error_detail_and_retry_after(gateway, client, llm_responds):
+    llm_responds(httpx.Response(429, json={"detail": "Too many generations in flight"}, headers={"Retry-After": "3"}))
+
+    response = client.post("/chat/stream", json={"message": "Who was Augustine?"}, headers=_auth(gateway))
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many generations in flight"}
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_stream_falls_back_to_raw_text_for_non_json_errors(gateway, client, llm_responds):
+    llm_responds(httpx.Response(502, text="Bad Gateway"))
+
+    response = client.post("/chat/stream", json={"message": "Who was Augustine?"}, headers=_auth(gateway))
+
+    assert response.status_code == 502
+    assert response.json() == {"detail": "Bad Gateway"}
+    assert "Retry-After" not in response.headers
@@ -0,0 +1,41 @@
+import asyncio
+import json
+import os
+
+from content_service import ContentStore
+
+
+def _write(path, eras, mtime):
+    with open(path, "w") as f:
+        json.dump({"eras": eras}, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_hot_reload_survives_a_failing_listener(tmp_path):
+    path = str(tmp_path / "church_history.json")
+    _write(path, [{"id": "early", "events": []}], 1_000_000_000)
+    store = ContentStore(path=path, reload_interval=0.01)
+
+    def listener(snapshot):
+        if any(era.get("name") == "bad" for era in snapshot.eras):
+            raise TypeError("malformed edit")
+
+    store.listeners.append(listener)
+
+    async def scenario():
+        store.start()
+        try:
+            first = store.snapshot
+            _write(path, [{"id": "early", "name": "bad", "events": []}], 2_000_000_000)
+            await asyncio.sleep(0.1)
+            # The failed reload keeps the previous snapshot and the watcher alive
+            assert store.snapshot is first
+            assert not store._task.done()
+
+            _write(path, [{"id": "medieval", "events": []}], 3_000_000_000)
+            await asyncio.sleep(0.1)
+            assert [era["id"] for era in store.snapshot.eras] == ["medieval"]
+        finally:
+            await store.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import pytest
+
+from content_service import DEFAULT_CONTENT_PATH, ContentSnapshot
+from search_index import EventSearchIndex, tokenize
+
+
+@pytest.fixture(scope="module")
+def index():
+    with open(DEFAULT_CONTENT_PATH, "rb") as f:
+        return EventSearchIndex(ContentSnapshot(f.read()).eras)
+
+
+def ids(index, query):
+    total, events = index.search(query, limit=1000)
+    assert total == len(events)
+    return {event["id"] for event in events}
+
+
+def test_tokenize_folds_plurals():
+    assert tokenize("The Councils of Nicaea") == ["council", "nicaea"]
+    assert tokenize("Moses crossed") == ["mose", "crossed"]
+    assert tokenize("Cross") == ["cross"]
+
+
+@pytest.mark.parametrize("plural, singular", [("Councils", "council"), ("crusades", "Crusade")])
+def test_plural_and_singular_queries_match_the_same_events(index, plural, singular):
+    assert ids(index, plural)
+    assert ids(index, plural) == ids(index, singular)
+
+
+def test_repeated_event_ids_are_indexed_once(index):
+    all_ids = [event["id"] for event in index.events]
+    assert len(all_ids) == len(set(all_ids))
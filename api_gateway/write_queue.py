@@ -0,0 +1,81 @@
+"""
+Background write queue for the API gateway.
+
+Jobs are coroutine functions that persist data to the storage service. They run
+off the request path on a fixed set of worker tasks. Every job carries a key
+(the user id) and all jobs for the same key go to the same worker, so they run
+one at a time in submission order. That keeps read-modify-write cycles for one
+user from interleaving inside a gateway process.
+"""
+
+import asyncio
+import zlib
+from typing import Awaitable, Callable, List, Optional
+
+
+class WriteQueue:
+    """Bounded, keyed background job queue with retry."""
+
+    def __init__(self, workers: int = 4, max_size: int = 1000, max_retries: int = 3, retry_delay: float = 0.5):
+        self.workers = max(1, workers)
+        # Each worker gets its own queue; the total bound is split between them.
+        self.max_size = max(1, max_size // self.workers)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.failed_jobs = 0
+
+    def start(self):
+        self._queues = [asyncio.Queue(maxsize=self.max_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def stop(self, timeout: float = 10.0):
+        """Wait (up to `timeout` seconds) for queued jobs to finish, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            pending = sum(q.qsize() for q in self._queues)
+            print(f"Write queue shutdown timed out with {pending} job(s) still pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def submit(self, key, job: Callable[[], Awaitable[None]], description: Optional[str] = None):
+        """Queue `job` behind any earlier jobs with the same key.
+
+        When the worker's queue is full this waits for space, which pushes back
+        on callers instead of dropping writes.
+        """
+        queue = self._queues[zlib.crc32(str(key).encode()) % self.workers]
+        await queue.put((job, description or str(key)))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job, description = await queue.get()
+            try:
+                await self._run_with_retry(job, description)
+            finally:
+                queue.task_done()
+
+    async def _run_with_retry(self, job, description):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await job()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.max_retries:
+                    delay = self.retry_delay * (2 ** (attempt - 1))
+                    print(f"Background write '{description}' failed (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                else:
+                    self.failed_jobs += 1
+                    print(f"Background write '{description}' failed after {self.max_retries} attempts: {e}")
@@ -0,0 +1,134 @@
+"""
+Admission control for generations against the local model.
+
+Ollama serves one model on limited hardware. Letting every request start a
+generation at once only makes all of them slow together until the gateway
+times out. The controller admits at most `max_concurrent` generations. Up to
+`max_queue` more wait in priority order (short and first-turn questions first)
+for at most `max_wait` seconds. Anything beyond that is rejected straight away
+with a Retry-After hint, so clients can back off.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from .backend_pool import ollama_hosts_from_env
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted; maps to an HTTP error with Retry-After."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Semaphore with a bounded priority wait queue and wait-time metrics."""
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 16, max_wait: float = 60.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._wait_times = deque(maxlen=500)
+        self._service_times = deque(maxlen=100)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> int:
+        """Estimate (in whole seconds) when a new request could be admitted."""
+        avg_service = (sum(self._service_times) / len(self._service_times)) if self._service_times else 5.0
+        return max(1, math.ceil(avg_service * (self.queue_depth + 1) / self.max_concurrent))
+
+    def check_capacity(self):
+        """Reject immediately if the request would not even fit in the wait queue."""
+        if self.active >= self.max_concurrent and self.queue_depth >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "LLM service is at capacity, please retry shortly", self.retry_after())
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        self.check_capacity()
+        started = time.monotonic()
+        if self.active < self.max_concurrent and self.queue_depth == 0:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), future))
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+            except asyncio.TimeoutError:
+                if not future.done():
+                    future.cancel()
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(503, "LLM service is busy, please retry shortly", self.retry_after())
+            except asyncio.CancelledError:
+                # The slot may have been handed over just as the caller went away
+                if future.done() and not future.cancelled():
+                    self.release()
+                else:
+                    future.cancel()
+                raise
+        self.admitted += 1
+        self._wait_times.append(time.monotonic() - started)
+
+    def release(self):
+        # Hand the slot straight to the best waiting request, if any
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL):
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_times.append(time.monotonic() - started)
+            self.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_avg_ms": (sum(waits) / len(waits) * 1000) if waits else 0.0,
+            "wait_p95_ms": (waits[int(len(waits) * 0.95)] * 1000) if waits else 0.0,
+            "wait_max_ms": (waits[-1] * 1000) if waits else 0.0,
+        }
+
+
+def create_admission_controller_from_env() -> AdmissionController:
+    return AdmissionController(
+        # Defaults to two generations per Ollama replica
+        max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", str(2 * len(ollama_hosts_from_env())))),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+        max_wait=float(os.getenv("LLM_MAX_QUEUE_WAIT", "60")),
+    )
@@ -1,10 +1,34 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-from .graph_church_history import app  # Import the Church History graph
-from langchain_core.messages import HumanMessage, AIMessage
+from .graph_church_history import app, llm, OLLAMA_MODEL, LLM_TEMPERATURE  # Import the Church History graph
+from .backend_pool import BackendPool
+from .response_cache import create_response_cache_from_env, make_cache_key
+from .semantic_cache import create_semantic_cache_from_env
+from .context_manager import build_messages
+from .admission import AdmissionRejected, PRIORITY_HIGH, PRIORITY_NORMAL, create_admission_controller_from_env
+from .coalescing import Flight, RequestCoalescer, prompt_key
+from .logging_utils import get_logger, log_event
+import json
+import logging
+import os
 
 router = APIRouter()
+logger = get_logger("api")
+
+# Exact-match cache of generated answers (configured via RESPONSE_CACHE_* env vars)
+response_cache = create_response_cache_from_env()
+# Similarity cache for paraphrased first-turn questions (SEMANTIC_CACHE_* env vars)
+semantic_cache = create_semantic_cache_from_env()
+# Bounds concurrent generations against the local model (LLM_MAX_* env vars)
+admission = create_admission_controller_from_env()
+
+# Identical prompts in flight at the same time share one generation
+coalescer = RequestCoalescer(enabled=os.getenv("COALESCE_REQUESTS", "1") == "1")
+
+# Questions up to this length (or the first turn of a conversation) jump the admission queue
+SHORT_MESSAGE_CHARS = int(os.getenv("SHORT_MESSAGE_CHARS", "200"))
 
 # This model matches the payload from the API Gateway
 class ChatRequest(BaseModel):
@@ -16,6 +40,106 @@ class ChatRequest(BaseModel):
     conversation_log: Optional[str] = None
     conversation_history: Optional[List[Dict[str, str]]] = None  # Full conversation history
     debug: Optional[bool] = False
+    use_cache: Optional[bool] = True  # Set False to bypass the response cache
+
+FALLBACK_RESPONSE = (
+    "I'm having a temporary issue, but I'm still here to help! "
+    "Could you please rephrase your church history question?"
+)
+
+
+def build_initial_state(request: ChatRequest):
+    """Build the church history graph's initial state from a chat request.
+
+    Prior turns are trimmed to the history token budget, with older turns
+    folded into the rolling memory summary. Returns (state, updated memory).
+    """
+    messages, new_memory = build_messages(
+        request.message,
+        conversation_history=request.conversation_history,
+        conversation_log=request.conversation_log,
+        memory=request.memory,
+    )
+    state = {
+        "messages": messages,
+        "user_id": request.user_id,
+        "final_response": None,
+        "final_response_readme": None,
+        "retrieved_context": None,
+    }
+    return state, new_memory
+
+
+def with_memory(resp: dict, request: ChatRequest, new_memory: str) -> dict:
+    """Attach the updated memory summary for the gateway to persist, if it changed."""
+    if new_memory != (request.memory or ""):
+        return {**resp, "memory": new_memory}
+    return resp
+
+
+def build_response(request: ChatRequest, result_state: dict) -> dict:
+    """Shape the graph's final state into the response payload sent to the gateway."""
+    final_answer = result_state.get("final_response")
+    final_answer_readme = result_state.get("final_response_readme")
+
+    if not final_answer:
+        final_answer = "I couldn't process that request. Please try rephrasing your question."
+
+    resp = {
+        "response": final_answer_readme if final_answer_readme else final_answer,
+        "response_markdown": final_answer_readme,
+        "response_text": final_answer,
+    }
+    if request.debug:
+        resp["state_messages"] = [m.content for m in result_state.get("messages", [])]
+    return resp
+
+
+def response_cache_key(request: ChatRequest, messages) -> Optional[str]:
+    """Cache key for this request, or None when the cache must be bypassed.
+
+    The key covers the context actually sent to the model (recent turns and
+    memory summary), not just the question.
+    """
+    if not response_cache.enabled or not request.use_cache or request.debug:
+        return None
+    history = [{"role": m.type, "content": m.content} for m in messages[:-1]]
+    return make_cache_key(request.message, history, OLLAMA_MODEL, LLM_TEMPERATURE)
+
+
+async def lookup_cached_response(request: ChatRequest, messages):
+    """Check the exact-match cache, then the semantic cache for first-turn questions.
+
+    Returns (cached response or None, cache context). The context is passed to
+    store_cached_response so a fresh answer can be stored without re-embedding.
+    """
+    cache_key = response_cache_key(request, messages)
+    if not cache_key:
+        return None, None
+    cached = response_cache.get(cache_key)
+    if cached:
+        return {**cached, "cached": True, "cache_tier": "exact"}, None
+
+    vector = None
+    first_turn = len(messages) == 1
+    if first_turn and semantic_cache.enabled:
+        cached, vector = await semantic_cache.lookup(request.message)
+        if cached:
+            # Promote to the exact tier so the next identical question skips embedding
+            response_cache.set(cache_key, cached)
+            return {**cached, "cached": True, "cache_tier": "semantic"}, None
+    return None, (cache_key, vector)
+
+
+async def store_cached_response(request: ChatRequest, cache_context, result_state: dict, resp: dict):
+    """Store a freshly generated answer in the cache tiers it was looked up in."""
+    if cache_context is None or not result_state.get("cacheable"):
+        return
+    cache_key, vector = cache_context
+    response_cache.set(cache_key, resp)
+    if vector is not None:
+        await semantic_cache.add(request.message, vector, resp)
+
 
 @router.post("/invoke_agent_graph")
 async def invoke_chat(request: ChatRequest):
@@ -25,64 +149,163 @@ async def invoke_chat(request: ChatRequest):
     Supports full conversation history for context-aware responses.
     """
     
-    print(f"\n{'='*60}")
-    print(f"📨 New Chat Request from user: {request.user_id}")
-    print(f"💬 Message: {request.message}")
-    if request.conversation_history:
-        print(f"📚 Conversation history: {len(request.conversation_history)} messages")
-    print(f"{'='*60}\n")
-    
-    # 1. Build message history from conversation_history
-    messages = []
-    if request.conversation_history:
-        for msg in request.conversation_history[:-1]:  # Exclude the latest message (it will be added separately)
-            if msg.get('role') == 'user':
-                messages.append(HumanMessage(content=msg.get('content', '')))
-            elif msg.get('role') == 'assistant':
-                messages.append(AIMessage(content=msg.get('content', '')))
-    
-    # Add the current message
-    messages.append(HumanMessage(content=request.message))
+    log_event(
+        logger, logging.INFO, "chat_request",
+        user_id=request.user_id,
+        message_chars=len(request.message),
+        history=len(request.conversation_history or ()),
+    )
     
-    # 2. Define the initial state for the church history graph
-    initial_state = {
-        "messages": messages,
-        "user_id": request.user_id,
-        "final_response": None,
-        "final_response_readme": None,
-    }
+    # 1. Build the initial state for the church history graph
+    initial_state, new_memory = build_initial_state(request)
+
+    # 2. Serve repeated (or paraphrased) questions from the response caches
+    cached, cache_context = await lookup_cached_response(request, initial_state["messages"])
+    if cached:
+        log_event(logger, logging.INFO, "chat_cache_hit", user_id=request.user_id, tier=cached["cache_tier"])
+        return with_memory(cached, request, new_memory)
     
     try:
-        # 2. Invoke the compiled church history graph with full conversation history
-        result_state = await app.ainvoke(initial_state)
-
-        # 3. Extract the final synthesized response
-        final_answer = result_state.get("final_response")
-        final_answer_readme = result_state.get("final_response_readme")
-
-        if not final_answer:
-            final_answer = "I couldn't process that request. Please try rephrasing your question."
-        
-        print(f"\n{'='*60}")
-        print(f"✅ Response generated successfully")
-        print(f"📤 Sending response back to user")
-        print(f"{'='*60}\n")
+        # 3. Run the graph, or join an identical generation already in flight
+        flight = start_generation(request, initial_state, cache_context)
+        result_state = await flight.wait()
+        log_event(logger, logging.INFO, "chat_response", user_id=request.user_id)
         
-        resp = {
-            "response": final_answer_readme if final_answer_readme else final_answer,
-            "response_markdown": final_answer_readme,
-            "response_text": final_answer,
-        }
-        if request.debug:
-            resp["state_messages"] = [m.content for m in result_state.get("messages", [])]
-        return resp
+        # 4. Extract the final synthesized response
+        resp = build_response(request, result_state)
+        return with_memory(resp, request, new_memory)
     
+    except AdmissionRejected as e:
+        log_event(logger, logging.WARNING, "chat_rejected", user_id=request.user_id, detail=e.detail)
+        return rejection_response(e)
+    except Exception as e:
+        log_event(logger, logging.ERROR, "chat_failed", user_id=request.user_id, error=str(e))
+        return {"response": FALLBACK_RESPONSE}
+
+
+def admission_priority(request: ChatRequest, messages) -> int:
+    if len(messages) == 1 or len(request.message) <= SHORT_MESSAGE_CHARS:
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
+
+
+def rejection_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"detail": e.detail},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def run_graph(initial_state: dict, priority: int, flight: Flight) -> dict:
+    """Run the graph once a model slot is free, publishing answer tokens to the flight."""
+    result_state = initial_state
+    async with admission.slot(priority):
+        async for mode, payload in app.astream(initial_state, stream_mode=["messages", "values"]):
+            if mode == "messages":
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") == "church_history" and chunk.content:
+                    flight.publish(chunk.content)
+            else:
+                result_state = payload
+    return result_state
+
+
+def start_generation(request: ChatRequest, initial_state: dict, cache_context) -> Flight:
+    """Join the in-flight generation for this exact prompt, or start a new one.
+
+    The request that starts a flight also caches its answer, from inside the
+    flight, so the answer is stored exactly once even if that client disconnects.
+    """
+    messages = initial_state["messages"]
+    priority = admission_priority(request, messages)
+
+    async def run(flight: Flight) -> dict:
+        result_state = await run_graph(initial_state, priority, flight)
+        await store_cached_response(request, cache_context, result_state, build_response(request, result_state))
+        return result_state
+
+    flight, _ = coalescer.join(prompt_key(messages, OLLAMA_MODEL, LLM_TEMPERATURE), run)
+    return flight
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_graph_events(request: ChatRequest, initial_state: dict, new_memory: str):
+    """Run the graph and yield SSE events as the answer is generated.
+
+    Emits a `token` event for each chunk the model produces in the
+    church_history node, then a single `done` event carrying the same payload
+    as the non-streaming endpoint (or the fallback payload on error).
+    """
+    cached, cache_context = await lookup_cached_response(request, initial_state["messages"])
+    if cached:
+        yield _sse("token", {"token": cached["response"]})
+        yield _sse("done", with_memory(cached, request, new_memory))
+        return
+
+    try:
+        flight = start_generation(request, initial_state, cache_context)
+        async for token in flight.stream():
+            yield _sse("token", {"token": token})
+        result_state = await flight.wait()
+        yield _sse("done", with_memory(build_response(request, result_state), request, new_memory))
+    except AdmissionRejected as e:
+        yield _sse("error", {"detail": e.detail, "retry_after": e.retry_after})
     except Exception as e:
-        print(f"\n{'='*60}")
-        print(f"❌ ERROR invoking Church History graph: {e}")
-        print(f"{'='*60}\n")
-        fallback = (
-            "I'm having a temporary issue, but I'm still here to help! "
-            "Could you please rephrase your church history question?"
-        )
-        return {"response": fallback}
\ No newline at end of file
+        log_event(logger, logging.ERROR, "chat_stream_failed", user_id=request.user_id, error=str(e))
+        yield _sse("done", {"response": FALLBACK_RESPONSE})
+
+
+@router.post("/invoke_agent_graph/stream")
+async def invoke_chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /invoke_agent_graph.
+    Returns a text/event-stream of `token` events followed by a final `done`
+    event, so clients can show the answer while it is being generated.
+    """
+    log_event(logger, logging.INFO, "chat_stream_request", user_id=request.user_id, message_chars=len(request.message))
+    initial_state, new_memory = build_initial_state(request)
+    # Reject before the stream starts when even the wait queue is full (unless
+    # an identical generation is already running and can simply be joined); a
+    # queue-wait timeout later in the stream is reported as an `error` event.
+    key = prompt_key(initial_state["messages"], OLLAMA_MODEL, LLM_TEMPERATURE)
+    if not coalescer.in_flight(key):
+        try:
+            admission.check_capacity()
+        except AdmissionRejected as e:
+            return rejection_response(e)
+    return StreamingResponse(
+        stream_graph_events(request, initial_state, new_memory),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters and size of the exact-match and semantic caches."""
+    return {"exact": response_cache.stats(), "semantic": semantic_cache.stats()}
+
+
+@router.get("/admission/stats")
+def admission_stats():
+    """Concurrency, queue depth, rejection counts and queue wait times."""
+    return admission.stats()
+
+
+@router.get("/coalescing/stats")
+def coalescing_stats():
+    """How many requests shared an in-flight generation and how many ran their own."""
+    return coalescer.stats()
+
+
+@router.get("/backends/stats")
+def backend_stats():
+    """Health, circuit state and outstanding requests of each Ollama backend."""
+    if not isinstance(llm, BackendPool):
+        return {"backends": []}
+    return llm.stats()
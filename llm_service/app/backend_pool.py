@@ -0,0 +1,213 @@
+"""
+Pool of Ollama backends for the Church History graph.
+
+One Ollama process runs one generation at a time, so a machine with many cores
+gets more chat throughput from several Ollama processes (e.g. on ports 11434,
+11435, ...) than from one. The pool holds a ChatOllama client per endpoint and
+sends each generation to the healthy backend with the fewest requests
+outstanding.
+
+Each backend has a circuit breaker. After `failure_threshold` consecutive
+failures it stops receiving traffic for `cooldown` seconds. After that, one
+trial request is let through, and its success closes the circuit again. A
+background health check (GET /api/tags) takes dead backends out of rotation
+and brings recovered ones back without waiting for user traffic.
+
+Configured with OLLAMA_HOSTS (comma separated; defaults to OLLAMA_HOST or the
+local default port), OLLAMA_HEALTH_INTERVAL, OLLAMA_CIRCUIT_FAILURES and
+OLLAMA_CIRCUIT_COOLDOWN.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import List, Optional
+
+import httpx
+from langchain_ollama import ChatOllama
+
+from .logging_utils import get_logger, log_event
+
+logger = get_logger("backend_pool")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Failures that happen before the backend produced any output, so the request
+# can safely be retried on another backend without duplicating streamed tokens
+CONNECT_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every backend is unhealthy or has an open circuit."""
+
+
+class Backend:
+    """One Ollama endpoint with its load and circuit-breaker state."""
+
+    def __init__(self, url: str, llm):
+        self.url = url
+        self.llm = llm
+        self.outstanding = 0
+        self.healthy = True
+        self.circuit = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, cooldown: float) -> bool:
+        if not self.healthy:
+            return False
+        if self.circuit == CIRCUIT_OPEN:
+            if time.monotonic() - self.opened_at < cooldown:
+                return False
+            self.circuit = CIRCUIT_HALF_OPEN
+        if self.circuit == CIRCUIT_HALF_OPEN:
+            return not self.trial_in_flight
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.circuit,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class BackendPool:
+    """Least-outstanding-requests routing over several Ollama backends.
+
+    Exposes `ainvoke(messages)` like a chat model, so the graph uses it in
+    place of a single ChatOllama.
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        health_interval: float = 10.0,
+    ):
+        self.backends = backends
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self._rotation = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [backend.url for backend in self.backends]
+
+    def pick(self, exclude=()) -> Backend:
+        """The available backend with the fewest outstanding requests."""
+        candidates = [b for b in self.backends if b not in exclude and b.available(self.cooldown)]
+        if not candidates:
+            raise NoBackendAvailable("No LLM backend is currently available")
+        # Rotate the starting point so ties are spread across backends
+        start = next(self._rotation) % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        return min(candidates, key=lambda b: b.outstanding)
+
+    def _record_success(self, backend: Backend):
+        backend.consecutive_failures = 0
+        if backend.circuit != CIRCUIT_CLOSED:
+            log_event(logger, logging.INFO, "circuit_closed", url=backend.url)
+        backend.circuit = CIRCUIT_CLOSED
+
+    def _record_failure(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.circuit == CIRCUIT_HALF_OPEN or backend.consecutive_failures >= self.failure_threshold:
+            backend.circuit = CIRCUIT_OPEN
+            backend.opened_at = time.monotonic()
+            log_event(logger, logging.WARNING, "circuit_opened", url=backend.url, error=str(error))
+
+    async def ainvoke(self, messages, **kwargs):
+        tried = []
+        while True:
+            backend = self.pick(exclude=tried)
+            tried.append(backend)
+            trial = backend.circuit == CIRCUIT_HALF_OPEN
+            backend.trial_in_flight = trial
+            backend.outstanding += 1
+            backend.requests += 1
+            try:
+                response = await backend.llm.ainvoke(messages, **kwargs)
+            except CONNECT_ERRORS as e:
+                self._record_failure(backend, e)
+                if len(tried) < len(self.backends):
+                    log_event(logger, logging.WARNING, "backend_retry", url=backend.url, error=str(e))
+                    continue
+                raise
+            except Exception as e:
+                self._record_failure(backend, e)
+                raise
+            else:
+                self._record_success(backend)
+                return response
+            finally:
+                backend.outstanding -= 1
+                if trial:
+                    backend.trial_in_flight = False
+
+    async def check_health(self, client: httpx.AsyncClient):
+        async def check(backend: Backend):
+            try:
+                response = await client.get(f"{backend.url}/api/tags")
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != backend.healthy:
+                log_event(logger, logging.WARNING if not healthy else logging.INFO,
+                          "backend_health", url=backend.url, healthy=healthy)
+            backend.healthy = healthy
+
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def _run_health_checks(self):
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                await self.check_health(client)
+                await asyncio.sleep(self.health_interval)
+
+    def start(self):
+        if self.health_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run_health_checks())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"backends": [backend.stats() for backend in self.backends]}
+
+
+def ollama_hosts_from_env() -> List[str]:
+    default = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    hosts = [h.strip().rstrip("/") for h in os.getenv("OLLAMA_HOSTS", default).split(",") if h.strip()]
+    return [h if "://" in h else f"http://{h}" for h in hosts]
+
+
+def create_backend_pool_from_env(**llm_kwargs) -> BackendPool:
+    """One ChatOllama per host in OLLAMA_HOSTS, all with the same model settings."""
+    backends = [Backend(url, ChatOllama(base_url=url, **llm_kwargs)) for url in ollama_hosts_from_env()]
+    return BackendPool(
+        backends,
+        failure_threshold=int(os.getenv("OLLAMA_CIRCUIT_FAILURES", "3")),
+        cooldown=float(os.getenv("OLLAMA_CIRCUIT_COOLDOWN", "30")),
+        health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+    )
@@ -0,0 +1,126 @@
+"""
+Single-flight coalescing of identical in-flight generations.
+
+When a class asks the same question within a few seconds, the prompts the
+model would see are identical, so generating each of them separately only
+wastes model time. The first request for a prompt starts a "flight" (one
+background graph run). Requests for the same prompt that arrive while it is
+still running join it. Every participant receives the same tokens, which are
+replayed from the start for late joiners, and the same final state.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Tuple
+
+
+def prompt_key(messages, model: str, temperature: float) -> str:
+    """Hash of the exact prompt messages plus the generation settings."""
+    blob = json.dumps([(m.type, m.content) for m in messages], ensure_ascii=False)
+    return hashlib.sha256(f"{model}\x1f{temperature:.3f}\x1f{blob}".encode("utf-8")).hexdigest()
+
+
+class FlightCancelled(Exception):
+    """The shared generation was cancelled before it finished."""
+
+
+class Flight:
+    """One shared generation: a replayable token stream plus a final result."""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done = True
+        self._notify()
+
+    async def stream(self):
+        """Yield every token of the flight, from the first one, as they arrive."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.tokens):
+                yield self.tokens[index]
+                index += 1
+            if self.done:
+                return
+            await changed.wait()
+
+    async def wait(self):
+        """Wait for the final result (re-raising the flight's error, if any)."""
+        while not self.done:
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RequestCoalescer:
+    """Registry of in-flight generations keyed by prompt."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        return self.enabled and key in self._flights
+
+    def join(self, key: str, run: Callable[[Flight], Awaitable[object]]) -> Tuple[Flight, bool]:
+        """Join the flight for `key`, starting `run(flight)` if none is running.
+
+        Returns (flight, started) where `started` is True for the request
+        that launched the flight. The run happens in its own task, so a
+        disconnecting client never cancels a generation others are waiting on.
+        """
+        flight = self._flights.get(key) if self.enabled else None
+        if flight is not None:
+            self.coalesced += 1
+            return flight, False
+        flight = Flight()
+        self.started += 1
+        if self.enabled:
+            self._flights[key] = flight
+        flight.task = asyncio.create_task(self._run(key, flight, run))
+        return flight, True
+
+    async def _run(self, key, flight, run):
+        try:
+            flight.finish(result=await run(flight))
+        except Exception as e:
+            flight.finish(error=e)
+        except asyncio.CancelledError:
+            # Wake every participant instead of leaving them waiting forever
+            flight.finish(error=FlightCancelled("generation was cancelled"))
+            raise
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        total = self.started + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            # Generations actually run: requests that found no identical prompt in flight
+            "not_coalesced": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_rate": (self.coalesced / total) if total else 0.0,
+        }
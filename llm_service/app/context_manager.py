@@ -0,0 +1,138 @@
+"""
+Token-budgeted conversation context for the Church History assistant.
+
+Prior turns come from the request's conversation_history when the client sends
+one. Otherwise they come from the stored conversation_log the gateway forwards.
+The most recent turns are kept verbatim while they fit in the token budget.
+Older turns are folded into the user's rolling `memory` summary, which goes to
+the model as a short system message and is returned to the gateway for storage.
+Prompt size, and with it prefill latency, stays bounded however long a
+conversation runs.
+"""
+
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "1200"))
+MEMORY_TOPIC_CHARS = 160
+
+Turn = Tuple[str, str]  # (role, content) with role "user" or "assistant"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+def turns_from_history(conversation_history) -> List[Turn]:
+    return [
+        (msg["role"], msg.get("content", ""))
+        for msg in conversation_history
+        if msg.get("role") in ("user", "assistant")
+    ]
+
+
+def turns_from_log(conversation_log: Optional[str]) -> List[Turn]:
+    """Parse either stored conversation_log format into ordered turns."""
+    try:
+        parsed = json.loads(conversation_log or "[]")
+    except ValueError:
+        return []
+    turns = []
+    if isinstance(parsed, dict):
+        prompts = parsed.get("recent_user_prompts") or []
+        answers = parsed.get("recent_assistant_responses") or []
+        # Both lists are appended together, so align them from the most recent end
+        offset = len(answers) - len(prompts)
+        for i, prompt in enumerate(prompts):
+            turns.append(("user", prompt or ""))
+            if 0 <= i + offset < len(answers):
+                turns.append(("assistant", answers[i + offset] or ""))
+    elif isinstance(parsed, list):
+        for entry in parsed:
+            if isinstance(entry, dict) and entry.get("role") in ("user", "assistant"):
+                turns.append((entry["role"], entry.get("text") or ""))
+    return turns
+
+
+def fit_to_budget(turns: List[Turn], budget: int) -> Tuple[List[Turn], List[Turn]]:
+    """Split turns into (older turns to fold away, recent turns that fit the budget)."""
+    used = 0
+    start = len(turns)
+    while start > 0:
+        cost = estimate_tokens(turns[start - 1][1])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    # Never open the kept window on an assistant turn without its question
+    if start < len(turns) and turns[start][0] == "assistant":
+        start += 1
+    return turns[:start], turns[start:]
+
+
+def _topic(text: str) -> str:
+    """First sentence of a user question, trimmed for the summary."""
+    sentence = re.split(r"(?<=[.?!])\s", text.strip(), maxsplit=1)[0]
+    if len(sentence) > MEMORY_TOPIC_CHARS:
+        sentence = sentence[:MEMORY_TOPIC_CHARS].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+
+def fold_into_memory(memory: Optional[str], dropped: List[Turn]) -> str:
+    """Add the questions from dropped turns to the rolling summary.
+
+    The summary is one "- topic" line per earlier question. Lines already
+    present are not repeated, and the oldest lines are dropped once the
+    summary exceeds MEMORY_MAX_CHARS.
+    """
+    lines = [line for line in (memory or "").splitlines() if line.strip()]
+    seen = set(lines)
+    for role, content in dropped:
+        if role != "user" or not content.strip():
+            continue
+        line = f"- {_topic(content)}"
+        if line not in seen:
+            lines.append(line)
+            seen.add(line)
+    while lines and len("\n".join(lines)) > MEMORY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_messages(
+    message: str,
+    conversation_history=None,
+    conversation_log: Optional[str] = None,
+    memory: Optional[str] = None,
+    budget: int = HISTORY_TOKEN_BUDGET,
+) -> Tuple[List[BaseMessage], str]:
+    """Build the prompt messages for a chat turn.
+
+    Returns (messages, updated memory). The messages are an optional summary
+    system message, the recent turns that fit in `budget`, then the current
+    question.
+    """
+    if conversation_history:
+        # The latest entry is the current message, which is added separately
+        turns = turns_from_history(conversation_history[:-1])
+    else:
+        turns = turns_from_log(conversation_log)
+
+    dropped, kept = fit_to_budget(turns, budget)
+    new_memory = fold_into_memory(memory, dropped)
+
+    # Only the kept window is converted to message objects, in one pass
+    messages: List[BaseMessage] = [
+        HumanMessage(content=content) if role == "user" else AIMessage(content=content)
+        for role, content in kept
+    ]
+    messages.append(HumanMessage(content=message))
+    if new_memory:
+        messages.insert(0, SystemMessage(content="Earlier in this conversation the user asked about:\n" + new_memory))
+    return messages, new_memory
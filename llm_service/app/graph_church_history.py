@@ -6,15 +6,25 @@ A simplified LLM system for answering church history questions
 import os
 from typing import TypedDict, List, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END
 import json
+import logging
+from .backend_pool import create_backend_pool_from_env
+from .retrieval import load_or_build_index
+from .logging_utils import get_logger, log_event
+
+logger = get_logger("graph")
 
 # Use a local model via Ollama
 # If Ollama is not available, this will fail gracefully
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))
+# How long Ollama keeps the model loaded after a request ("-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
 try:
-    llm = ChatOllama(model="gemma3:1b", temperature=0.3)
+    # One client per Ollama replica in OLLAMA_HOSTS, routed to the least busy one
+    llm = create_backend_pool_from_env(model=OLLAMA_MODEL, temperature=LLM_TEMPERATURE, keep_alive=OLLAMA_KEEP_ALIVE)
 except Exception:
     # Fallback to a simpler configuration if Ollama fails
     llm = None
@@ -29,6 +39,10 @@ class ChurchHistoryState(TypedDict):
     user_id: str
     final_response: Optional[str]
     final_response_readme: Optional[str]
+    # True only when final_response came from the model (not a fallback/error text)
+    cacheable: Optional[bool]
+    # Snippets of relevant church history events selected by the retrieval node
+    retrieved_context: Optional[str]
 
 # ==========================================
 # CHURCH HISTORY SYSTEM PROMPT
@@ -66,6 +80,50 @@ Format your responses with:
 
 Remember: Be helpful and informative, but CONCISE. Users can always ask for more detail if they want it."""
 
+# Built once; every prompt starts with this same message (and so shares a cacheable prefix)
+SYSTEM_MESSAGE = SystemMessage(content=CHURCH_HISTORY_SYSTEM_PROMPT)
+
+OFFLINE_RESPONSE = """I appreciate your question about church history! However, I'm currently running in offline mode without access to my full AI capabilities.
+
+To give you the best answer, I recommend:
+1. Checking reliable church history sources like academic articles or books
+2. Visiting websites like Christianity.com or church-history databases
+3. Asking me again once the service is fully restored
+
+Feel free to ask any other questions about church history, and I'll do my best to help!"""
+
+
+# ==========================================
+# RETRIEVAL
+# ==========================================
+
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") == "1"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "2.0"))
+
+# Built (or loaded from disk) once at startup
+history_index = load_or_build_index() if RETRIEVAL_ENABLED else None
+
+
+async def retrieve_context(state: ChurchHistoryState) -> dict:
+    """Select the church history events most relevant to the latest question."""
+    if history_index is None:
+        return {"retrieved_context": None}
+
+    # Include the previous question so follow-ups like "tell me more" stay on topic
+    questions = [m.content for m in state.get("messages", []) if isinstance(m, HumanMessage)][-2:]
+    results = history_index.search(" ".join(questions), k=RETRIEVAL_TOP_K, min_score=RETRIEVAL_MIN_SCORE)
+    if not results:
+        return {"retrieved_context": None}
+
+    snippets = "\n\n".join(snippet for _, snippet in results)
+    return {
+        "retrieved_context": (
+            "Relevant reference material from the Church History app. Use it when it "
+            "answers the question, and prefer it over uncertain recollection:\n\n" + snippets
+        )
+    }
+
 
 # ==========================================
 # CHURCH HISTORY AGENT
@@ -75,55 +133,49 @@ async def church_history_agent(state: ChurchHistoryState) -> dict:
     """Main agent that processes questions about church history."""
     
     messages = state.get("messages", [])
-    
-    # Debug: Log conversation history
-    print(f"\n{'='*60}")
-    print(f"🤖 Processing {len(messages)} messages in conversation history:")
-    for i, msg in enumerate(messages):
-        msg_type = "User" if isinstance(msg, HumanMessage) else "AI"
-        content_preview = msg.content[:100] + "..." if len(msg.content) > 100 else msg.content
-        print(f"  {i+1}. [{msg_type}]: {content_preview}")
-    print(f"{'='*60}\n")
-    
-    # Create the prompt with system message and user messages
-    prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=CHURCH_HISTORY_SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="messages"),
-    ])
-    
-    # Format the prompt
-    formatted_prompt = prompt.format_messages(messages=messages)
+    context = state.get("retrieved_context")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, msg in enumerate(messages):
+            log_event(logger, logging.DEBUG, "prompt_message", index=i, type=msg.type, preview=msg.content[:100])
+
+    # System prompt, then any retrieved reference material, then the conversation
+    if context:
+        formatted_prompt = [SYSTEM_MESSAGE, SystemMessage(content=context), *messages]
+    else:
+        formatted_prompt = [SYSTEM_MESSAGE, *messages]
+    log_event(logger, logging.INFO, "generate", messages=len(messages), grounded=bool(context))
     
     try:
         if llm is None:
             # Fallback response if LLM is not available
-            response_text = """I appreciate your question about church history! However, I'm currently running in offline mode without access to my full AI capabilities.
-
-To give you the best answer, I recommend:
-1. Checking reliable church history sources like academic articles or books
-2. Visiting websites like Christianity.com or church-history databases
-3. Asking me again once the service is fully restored
-
-Feel free to ask any other questions about church history, and I'll do my best to help!"""
+            response_text = OFFLINE_RESPONSE
             response_markdown = response_text
+            cacheable = False
         else:
-            # Get response from LLM
+            # Get response from LLM. When the graph is run with
+            # app.astream(stream_mode="messages"), LangGraph's callbacks make this
+            # call stream and tokens are emitted as they are generated.
             response = await llm.ainvoke(formatted_prompt)
             response_text = response.content
             response_markdown = response.content
+            cacheable = bool(response_text)
         
         return {
             "final_response": response_text,
             "final_response_readme": response_markdown,
+            "cacheable": cacheable,
         }
     
     except Exception as e:
+        log_event(logger, logging.ERROR, "generate_failed", error=str(e))
         error_response = f"""I encountered an issue processing your question: {str(e)}
 
 Please try again with a simpler question or check if the service is running properly."""
         return {
             "final_response": error_response,
             "final_response_readme": error_response,
+            "cacheable": False,
         }
 
 
@@ -133,11 +185,13 @@ Please try again with a simpler question or check if the service is running prop
 
 workflow = StateGraph(ChurchHistoryState)
 
-# Add the church history agent as the sole node
+# Retrieve grounding context, then answer
+workflow.add_node("retrieve", retrieve_context)
 workflow.add_node("church_history", church_history_agent)
 
 # Set entry point
-workflow.set_entry_point("church_history")
+workflow.set_entry_point("retrieve")
+workflow.add_edge("retrieve", "church_history")
 
 # Set exit point
 workflow.add_edge("church_history", END)
@@ -0,0 +1,58 @@
+"""
+Leveled, sampled, structured logging for the LLM service.
+
+Per-request logging goes through log_event. It returns immediately when the
+level is disabled, so the fields are never formatted. Records below WARNING
+are sampled at LOG_SAMPLE_RATE, which keeps console I/O off the hot path under
+load. Warnings and errors are always logged. Each record is one line of
+`event key=value ...`.
+
+LOG_LEVEL (default INFO) and LOG_SAMPLE_RATE (default 1.0) configure it.
+"""
+
+import logging
+import os
+import random
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+ROOT_LOGGER_NAME = "llm_service"
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Append a record's structured fields as key=value pairs."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+def _configure():
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+_configure()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields):
+    """Log `event` with structured fields, subject to level and sampling."""
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and LOG_SAMPLE_RATE < 1.0 and random.random() >= LOG_SAMPLE_RATE:
+        return
+    logger.log(level, event, extra={"fields": fields})
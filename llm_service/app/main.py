@@ -1,5 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from .api import router
+from .backend_pool import BackendPool
+from .graph_church_history import llm
+from .warmup import ModelWarmer
 import uvicorn
 
 app = FastAPI(
@@ -8,10 +12,31 @@ app = FastAPI(
 )
 app.include_router(router, prefix="/api/v1")
 
+# Loads the model at startup and keeps it resident in Ollama
+model_warmer = ModelWarmer()
+
+@app.on_event("startup")
+async def startup_event():
+    if isinstance(llm, BackendPool):
+        llm.start()
+    model_warmer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await model_warmer.stop()
+    if isinstance(llm, BackendPool):
+        await llm.stop()
+
 @app.get("/")
 def read_root():
     return {"status": "LLM Service is running"}
 
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 200 once the model is warmed up, 503 until then."""
+    status = model_warmer.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 if __name__ == "__main__":
     # Note: The gateway is configured for port 8001
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,147 @@
+"""
+BM25 retrieval over the app's church history content.
+
+The events in flutter_frontend/assets/data/church_history.json are indexed
+once at startup. The index is built in memory as an inverted index (term ->
+postings of (event, term frequency)) and saved next to this module, so later
+starts load it instead of re-tokenizing the dataset. The saved index is
+rebuilt whenever the source file's hash changes.
+
+The graph's retrieval node injects short snippets of the top-k events into the
+prompt, so the model answers from grounded, compact context.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+from collections import Counter
+from typing import List, Optional
+
+from .logging_utils import get_logger, log_event
+from .text_utils import tokenize
+
+logger = get_logger("retrieval")
+
+DEFAULT_DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "flutter_frontend", "assets", "data", "church_history.json"
+)
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "church_history_index.json")
+
+INDEX_VERSION = 2
+# Title and key figures are repeated so matches there outweigh passing mentions in details
+FIELD_WEIGHTS = {"title": 3, "keyFigures": 2, "tags": 2, "location": 1, "year": 1, "description": 1, "details": 1}
+SNIPPET_DETAIL_CHARS = 400
+
+
+def _event_text(event: dict) -> str:
+    parts = []
+    for field, weight in FIELD_WEIGHTS.items():
+        value = event.get(field) or ""
+        if isinstance(value, list):
+            value = " ".join(value)
+        parts.extend([value] * weight)
+    return " ".join(parts)
+
+
+def _event_snippet(event: dict, era_title: str) -> str:
+    header = event.get("title", "")
+    meta = ", ".join(v for v in (event.get("year"), event.get("location"), era_title) if v)
+    if meta:
+        header += f" ({meta})"
+    details = event.get("details") or ""
+    if len(details) > SNIPPET_DETAIL_CHARS:
+        details = details[:SNIPPET_DETAIL_CHARS].rsplit(" ", 1)[0] + "..."
+    lines = [header, event.get("description") or "", details]
+    if event.get("keyFigures"):
+        lines.append("Key figures: " + ", ".join(event["keyFigures"]))
+    return "\n".join(line for line in lines if line)
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of church history events."""
+
+    def __init__(self, postings: dict, doc_lengths: List[int], snippets: List[str], k1: float = 1.5, b: float = 0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.snippets = snippets
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        n = len(doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in postings.items()
+        }
+
+    @classmethod
+    def build(cls, data: dict) -> "BM25Index":
+        postings = {}
+        doc_lengths = []
+        snippets = []
+        seen_ids = set()
+        for era in data.get("eras", []):
+            for event in era.get("events", []):
+                # The dataset repeats a few events; index each id once (first entry wins)
+                event_id = event.get("id")
+                if event_id is not None:
+                    if event_id in seen_ids:
+                        continue
+                    seen_ids.add(event_id)
+                doc_id = len(doc_lengths)
+                counts = Counter(tokenize(_event_text(event)))
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append([doc_id, tf])
+                doc_lengths.append(sum(counts.values()))
+                snippets.append(_event_snippet(event, era.get("title", "")))
+        return cls(postings, doc_lengths, snippets)
+
+    def to_dict(self) -> dict:
+        return {"postings": self.postings, "doc_lengths": self.doc_lengths, "snippets": self.snippets}
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0):
+        """Return up to k (score, snippet) pairs, best first."""
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.snippets[doc_id]) for doc_id, score in best if score > min_score]
+
+
+def load_or_build_index(data_path: str = DEFAULT_DATA_PATH, index_path: str = DEFAULT_INDEX_PATH) -> Optional[BM25Index]:
+    """Load the saved index if it matches the data file, otherwise build and save it.
+
+    Returns None when the data file is missing, so retrieval is simply skipped.
+    """
+    try:
+        with open(data_path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        log_event(logger, logging.WARNING, "retrieval_disabled", path=data_path, error=str(e))
+        return None
+    source_hash = hashlib.sha256(raw).hexdigest()
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") == INDEX_VERSION and saved.get("source_hash") == source_hash:
+            return BM25Index(saved["postings"], saved["doc_lengths"], saved["snippets"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = BM25Index.build(json.loads(raw))
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "source_hash": source_hash, **index.to_dict()}, f)
+    except OSError as e:
+        log_event(logger, logging.WARNING, "retrieval_index_save_failed", path=index_path, error=str(e))
+    log_event(logger, logging.INFO, "retrieval_index_built", events=len(index.doc_lengths))
+    return index
@@ -0,0 +1,207 @@
+"""
+Semantic answer cache for first-turn church history questions.
+
+Catches paraphrases the exact-match cache misses ("what was decided at Nicaea"
+vs "outcome of the Council of Nicaea"). Questions are embedded into unit
+vectors kept in a preallocated NumPy matrix. A lookup is one matrix-vector
+product, and a cached answer is served when the best cosine similarity passes
+the configured threshold.
+
+Embedders:
+- HashingEmbedder: hashed TF-IDF over word tokens, no model or network needed
+  (default). IDF weights are fitted once at startup on the church history
+  content and then frozen, so stored and query vectors always share a scale.
+- OllamaEmbedder: a local Ollama embedding model (e.g. nomic-embed-text)
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .logging_utils import get_logger, log_event
+from .retrieval import DEFAULT_DATA_PATH
+from .text_utils import tokenize
+
+logger = get_logger("semantic_cache")
+
+
+def content_corpus(path: str = DEFAULT_DATA_PATH) -> List[str]:
+    """One document per church history event (title, description, details, figures, tags)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    docs = []
+    seen = set()
+    for era in data.get("eras", []):
+        for event in era.get("events", []):
+            # The dataset repeats a few events; count each id once (first entry wins)
+            if event.get("id") in seen:
+                continue
+            seen.add(event.get("id"))
+            parts = [event.get(field) or "" for field in ("title", "description", "details")]
+            parts += (event.get("keyFigures") or []) + (event.get("tags") or [])
+            docs.append(" ".join(parts))
+    return docs
+
+
+class HashingEmbedder:
+    """Hashed TF-IDF embeddings.
+
+    Tokens are hashed into `dim` buckets with sublinear term frequency. IDF
+    weights are fitted once on a fixed corpus and never change afterwards, so
+    common words like "church" count for less than names like "Nicaea"
+    without moving vectors already in the cache. With no corpus it is plain
+    hashed TF.
+    """
+
+    def __init__(self, dim: int = 1024, corpus: Iterable[str] = ()):
+        self.dim = dim
+        doc_freq = np.zeros(dim, dtype=np.float32)
+        docs = 0
+        for text in corpus:
+            for bucket in self._buckets(text):
+                doc_freq[bucket] += 1
+            docs += 1
+        self._idf = (np.log((1 + docs) / (1 + doc_freq)) + 1.0).astype(np.float32)
+
+    def _buckets(self, text: str):
+        counts = {}
+        for token in tokenize(text):
+            bucket = zlib.crc32(token.encode()) % self.dim
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        counts = self._buckets(text)
+        if not counts:
+            return None
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, count in counts.items():
+            vector[bucket] = (1.0 + math.log(count)) * self._idf[bucket]
+        return vector
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama embedding model."""
+
+    def __init__(self, model: str):
+        from langchain_ollama import OllamaEmbeddings
+
+        self._embeddings = OllamaEmbeddings(model=model)
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        return np.asarray(await self._embeddings.aembed_query(text), dtype=np.float32)
+
+
+class SemanticCache:
+    """Bounded cosine-similarity cache over question embeddings.
+
+    Rows live in a fixed-size matrix. When it is full, the least recently used
+    (or expired) row is overwritten.
+    """
+
+    def __init__(self, embedder, threshold: float = 0.9, max_entries: int = 2000, ttl: float = 3600.0):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._matrix: Optional[np.ndarray] = None
+        self._answers = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.embedder is not None
+
+    async def embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = await self.embedder.embed(question)
+        except Exception as e:
+            log_event(logger, logging.WARNING, "semantic_embed_failed", error=str(e))
+            return None
+        if vector is None:
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    async def lookup(self, question: str) -> Tuple[Optional[dict], Optional[np.ndarray]]:
+        """Return (cached answer or None, normalized query vector)."""
+        vector = await self.embed(question)
+        if vector is None or self._size == 0:
+            self.misses += 1
+            return None, vector
+        now = time.monotonic()
+        sims = self._matrix[: self._size] @ vector
+        sims[self._expires_at[: self._size] < now] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            self._last_used[best] = now
+            self.hits += 1
+            return self._answers[best], vector
+        self.misses += 1
+        return None, vector
+
+    async def add(self, question: str, vector: np.ndarray, answer: dict):
+        async with self._lock:
+            now = time.monotonic()
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                # Expired rows sort first (last_used forced to -inf), then LRU
+                last_used = np.where(self._expires_at < now, -np.inf, self._last_used)
+                row = int(np.argmin(last_used))
+            self._matrix[row] = vector
+            self._answers[row] = answer
+            self._last_used[row] = now
+            self._expires_at[row] = now + self.ttl
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "embedder": type(self.embedder).__name__ if self.embedder else None,
+            "threshold": self.threshold,
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+def create_semantic_cache_from_env() -> SemanticCache:
+    """Build the semantic cache configured by SEMANTIC_CACHE_* environment variables.
+
+    SEMANTIC_CACHE_EMBEDDER is one of "hashing" (default), "ollama" or "none".
+    """
+    embedder_name = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing").lower()
+    if embedder_name == "none":
+        embedder = None
+    elif embedder_name == "ollama":
+        embedder = OllamaEmbedder(os.getenv("SEMANTIC_CACHE_EMBED_MODEL", "nomic-embed-text"))
+    else:
+        try:
+            corpus = content_corpus()
+        except (OSError, ValueError) as e:
+            log_event(logger, logging.WARNING, "semantic_corpus_unavailable", error=str(e))
+            corpus = []
+        embedder = HashingEmbedder(int(os.getenv("SEMANTIC_CACHE_DIM", "1024")), corpus=corpus)
+    return SemanticCache(
+        embedder,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    )
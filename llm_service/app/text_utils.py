@@ -0,0 +1,23 @@
+"""
+Text helpers shared by the caching and retrieval modules.
+"""
+
+import re
+
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from how in is it of on or the to was were "
+    "what when where which who whom why with about tell me you can could please".split()
+)
+
+
+def tokenize(text: str):
+    """Lowercase word tokens with stopwords removed and simple plural folding."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        # Cheap plural folding so "councils" and "council" share a feature
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
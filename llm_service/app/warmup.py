@@ -0,0 +1,105 @@
+"""
+Model warm-up and keep-alive for the LLM service.
+
+Ollama loads a model lazily on its first request, so without a warm-up the
+first user after a restart pays for loading gemma3 into memory. At startup we
+send a one-token generation with the static system prompt, which loads the
+model and lets Ollama cache that shared prompt prefix. After that, a ping is
+repeated every KEEPALIVE_INTERVAL seconds so the model is never evicted while
+the service is idle. Every replica in OLLAMA_HOSTS is warmed and pinged;
+`ready` stays False until at least one of them has warmed up.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from langchain_core.messages import HumanMessage
+from langchain_ollama import ChatOllama
+
+from .backend_pool import ollama_hosts_from_env
+from .graph_church_history import LLM_TEMPERATURE, OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, SYSTEM_MESSAGE
+from .logging_utils import get_logger, log_event
+
+logger = get_logger("warmup")
+
+KEEPALIVE_INTERVAL = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "240"))
+WARMUP_RETRY_DELAY = float(os.getenv("OLLAMA_WARMUP_RETRY_DELAY", "5"))
+
+
+class ModelWarmer:
+    """Loads the model at startup, then keeps it resident with periodic pings."""
+
+    def __init__(self):
+        self.ready = False
+        self.last_error: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+        self.last_ping: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        # Same model settings as the graph's LLM, limited to a single output token
+        self._llms = [
+            ChatOllama(
+                base_url=url,
+                model=OLLAMA_MODEL,
+                temperature=LLM_TEMPERATURE,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                num_predict=1,
+            )
+            for url in ollama_hosts_from_env()
+        ]
+        self._prompt = [SYSTEM_MESSAGE, HumanMessage(content="Hello")]
+
+    async def ping(self):
+        """Ping every replica; fails only if none of them answered."""
+        results = await asyncio.gather(*(llm.ainvoke(self._prompt) for llm in self._llms), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(results):
+            raise errors[0]
+        self.last_ping = time.time()
+
+    async def _run(self):
+        delay = WARMUP_RETRY_DELAY
+        while not self.ready:
+            started = time.perf_counter()
+            try:
+                await self.ping()
+                self.warmup_seconds = time.perf_counter() - started
+                self.ready = True
+                self.last_error = None
+                log_event(logger, logging.INFO, "model_warm", model=OLLAMA_MODEL, seconds=round(self.warmup_seconds, 1))
+            except Exception as e:
+                self.last_error = str(e)
+                log_event(logger, logging.WARNING, "model_warmup_failed", error=str(e), retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            try:
+                await self.ping()
+            except Exception as e:
+                self.last_error = str(e)
+                log_event(logger, logging.WARNING, "model_keepalive_failed", error=str(e))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "model": OLLAMA_MODEL,
+            "warmup_seconds": self.warmup_seconds,
+            "last_ping": self.last_ping,
+            "last_error": self.last_error,
+        }
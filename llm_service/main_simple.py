@@ -9,18 +9,21 @@ This file mirrors the simple runners used by the other services in this repo
 this), but you can override using the `PORT` environment variable.
 """
 
+import logging
 import os
 import uvicorn
 
 # Import the FastAPI app defined in app/main.py
 try:
     from app.main import app
+    from app.logging_utils import get_logger, log_event
 except Exception:
     # If package import fails (e.g. running from a different cwd), try relative import
     from .app.main import app  # type: ignore
+    from .app.logging_utils import get_logger, log_event  # type: ignore
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8001"))
     host = os.getenv("HOST", "0.0.0.0")
-    print(f"Starting LLM service on {host}:{port}")
+    log_event(get_logger("main"), logging.INFO, "starting", host=host, port=port)
     uvicorn.run(app, host=host, port=port)
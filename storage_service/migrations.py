@@ -0,0 +1,75 @@
+"""
+Versioned schema migrations for the storage service.
+
+Each migration has a version number, a name and a function that takes a
+SQLAlchemy Connection. The versions already applied are recorded in the
+`schema_version` table. At startup only the pending migrations run, in version
+order, all in one transaction under a database-wide lock:
+
+- PostgreSQL: pg_advisory_xact_lock, released when the transaction ends
+- SQLite: BEGIN IMMEDIATE, which takes the database's write lock
+
+Replicas that start together wait for the first one to finish. Then they see
+every version recorded and start straight away, without racing on DDL.
+Migrations must leave a database that is already in their target state
+unchanged, because fresh databases get the current models from the first one.
+"""
+
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+from sqlalchemy.engine import Connection, Engine
+
+# Arbitrary constant shared by every replica: pg_advisory_xact_lock(key)
+MIGRATION_LOCK_KEY = 72_410_025
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _apply_pending(conn: Connection, migrations: List[Migration]) -> List[int]:
+    schema_version.create(conn, checkfirst=True)
+    done = set(conn.scalars(select(schema_version.c.version)))
+    applied = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in done:
+            continue
+        print(f"Applying migration {migration.version}: {migration.name}")
+        migration.apply(conn)
+        conn.execute(schema_version.insert().values(
+            version=migration.version, name=migration.name, applied_at=datetime.utcnow(),
+        ))
+        applied.append(migration.version)
+    return applied
+
+
+def run_migrations(engine: Engine, migrations: List[Migration]) -> List[int]:
+    """Apply pending migrations under the migration lock; return the versions applied."""
+    if engine.dialect.name == "sqlite":
+        # pysqlite's own transaction handling would not take the write lock up front
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                applied = _apply_pending(conn, migrations)
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+            return applied
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return _apply_pending(conn, migrations)